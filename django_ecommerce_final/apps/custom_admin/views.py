@@ -1,8 +1,11 @@
+from functools import partial
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.models import Q, Count
 from django.http import JsonResponse
+from django.utils import timezone
 from .decorators import admin_required
 from .utils import (
     get_dashboard_stats, get_recent_orders, get_top_selling_products,
@@ -12,7 +15,10 @@ from .utils import (
 from .forms import ProductForm, CategoryForm, CampaignForm, OrderStatusForm, SiteSettingsForm
 from .models import SiteSettings, Notification
 from apps.store.models import Product, Category, Campaign
+from apps.store import header
+from apps.orders import history, invoices, tracking
 from apps.orders.models import Order, OrderItem
+from apps.orders.reservations import convert_order, release_order
 from django.contrib.auth.models import User
 from apps.accounts.models import Profile
 
@@ -430,7 +436,30 @@ def order_bulk_status(request):
         order_ids = request.POST.getlist('order_ids')
         new_status = request.POST.get('new_status')
         if order_ids and new_status:
-            Order.objects.filter(id__in=order_ids).update(status=new_status)
+            orders = Order.objects.filter(id__in=order_ids)
+            with transaction.atomic():
+                rows = list(orders.exclude(status=new_status).values_list('id', 'user_id', 'order_number', 'delivery_status'))
+                orders.update(status=new_status, updated_at=timezone.now())
+                user_ids = {user_id for _, user_id, _, _ in rows}
+                # After commit, so a concurrent request cannot cache the old counts again
+                transaction.on_commit(lambda: header.invalidate(*user_ids))
+                # update() skips the signals that record the timeline, settle
+                # stock holds and refresh the stored invoice
+                tracking.log([(pk, number, new_status, delivery_status) for pk, _, number, delivery_status in rows])
+                changed = Order.objects.filter(pk__in=[row[0] for row in rows])
+                if new_status == 'completed':
+                    for order in changed.only('id'):
+                        invoices.schedule(order)
+                else:
+                    for order in changed.exclude(invoice='').exclude(invoice__isnull=True).only('id', 'invoice'):
+                        invoices.discard(order)
+                if new_status in ('completed', 'cancelled'):
+                    if new_status == 'completed':
+                        settle, unsettled = convert_order, ['active', 'released']
+                    else:
+                        settle, unsettled = partial(release_order, restock=True), ['active', 'converted']
+                    for order in orders.filter(reservations__status__in=unsettled).distinct():
+                        settle(order)
             messages.success(request, f'Successfully updated {len(order_ids)} orders to {new_status}.')
         else:
             messages.warning(request, 'No orders or status selected.')
@@ -474,16 +503,16 @@ def user_detail(request, pk):
     View user details and order history
     """
     user = get_object_or_404(User.objects.select_related('profile'), pk=pk)
-    orders = Order.objects.filter(user=user).order_by('-created_at')
-    
-    # Pagination for orders
-    paginator = Paginator(orders, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Keyset pages: a repeat buyer's deep pages cost as much as the first
+    orders, next_cursor = history.page(
+        Order.objects.filter(user=user), request.GET.get('cursor'), items=False,
+    )
     
     context = {
         'user_obj': user,
-        'page_obj': page_obj,
+        'orders': orders,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
     }
     return render(request, 'custom_admin/users/user_detail.html', context)
 
@@ -549,6 +578,9 @@ def mark_notification_read(request, pk):
 
 @admin_required
 def mark_all_notifications_read(request):
-    Notification.objects.filter(is_read=False).update(is_read=True)
+    unread = Notification.objects.filter(is_read=False)
+    user_ids = set(unread.exclude(user=None).values_list('user_id', flat=True))
+    unread.update(is_read=True)
+    header.invalidate(*user_ids)
     messages.success(request, "All notifications marked as read.")
     return redirect(request.META.get('HTTP_REFERER', 'custom_admin:dashboard'))
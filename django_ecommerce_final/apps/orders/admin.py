@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderItem
+from .models import Order, OrderEvent, OrderItem, PaymentEvent
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -7,6 +7,15 @@ class OrderItemInline(admin.TabularInline):
     can_delete = False
     extra = 0
 
+class OrderEventInline(admin.TabularInline):
+    model = OrderEvent
+    readonly_fields = ('status', 'delivery_status', 'created_at')
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('order_number', 'user', 'total', 'status', 'delivery_status', 'payment_method', 'created_at')
@@ -14,7 +23,7 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ('status', 'delivery_status', 'payment_method', 'created_at')
     search_fields = ('order_number', 'user__username', 'user__email')
     readonly_fields = ('order_number', 'transaction_id', 'created_at', 'updated_at')
-    inlines = [OrderItemInline]
+    inlines = [OrderItemInline, OrderEventInline]
     ordering = ('-created_at',)
 
     def get_queryset(self, request):
@@ -26,4 +35,11 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_filter = ('order__status',)
     search_fields = ('order__order_number', 'product__name')
     readonly_fields = ('order', 'product', 'quantity', 'price')
-    ordering = ('-order__created_at',)
\ No newline at end of file
+    ordering = ('-order__created_at',)
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'tran_id', 'order', 'outcome', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('kind', 'outcome')
+    search_fields = ('tran_id', 'val_id', 'order__order_number')
+    readonly_fields = [field.name for field in PaymentEvent._meta.fields]
+    ordering = ('-received_at',)
@@ -0,0 +1,74 @@
+"""
+Cancellation of SSLCommerz orders whose payment window has closed.
+
+``cancel_expired`` (``manage.py cancel_expired_orders``, which can keep
+running with ``--loop``) works set-based: per batch, one UPDATE cancels
+the orders, their stock comes back through ``reservations.release_orders``
+and the customers' notifications are written with one INSERT. A queryset
+update bypasses the ``Order`` signals, so what they would do on a
+cancellation (timeline entry included) is done here explicitly.
+
+With the sweeper running, pages that show orders only read them.
+"""
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from apps.store import header
+from . import invoices, tracking
+from .models import Order
+from .reservations import release_orders
+
+PAYABLE_STATUSES = ('pending', 'failed')
+
+
+def expired_orders(now=None):
+    return Order.objects.filter(
+        status__in=PAYABLE_STATUSES,
+        payment_method='sslcommerz',
+        payment_timeout__lt=now or timezone.now(),
+    )
+
+
+def _notify(orders):
+    from apps.custom_admin.models import Notification
+
+    url = reverse('orders')
+    Notification.objects.bulk_create([
+        Notification(
+            user_id=user_id,
+            title=f"Order #{order_number} cancelled",
+            message=f"The payment window for order #{order_number} closed before payment was received, "
+                    f"so the order has been cancelled.",
+            url=url,
+            notification_type='order',
+        )
+        for _, user_id, order_number, _ in orders
+    ])
+
+
+def cancel_expired(now=None, batch_size=500):
+    """Cancel every expired order, a batch per transaction. Returns the orders cancelled."""
+    now = now or timezone.now()
+    cancelled = 0
+    while True:
+        with transaction.atomic():
+            # Orders being paid right now are locked; the next run gets them
+            orders = list(
+                expired_orders(now).select_for_update(skip_locked=True)
+                .order_by('id').values_list('id', 'user_id', 'order_number', 'invoice')[:batch_size]
+            )
+            if not orders:
+                break
+            order_ids = [order[0] for order in orders]
+            Order.objects.filter(pk__in=order_ids).update(
+                status='cancelled', delivery_status='cancelled', updated_at=now,
+            )
+            tracking.log([(pk, number, 'cancelled', 'cancelled') for pk, _, number, _ in orders], now)
+            release_orders(order_ids, now)
+            _notify(orders)
+            for order in Order.objects.filter(pk__in=[order[0] for order in orders if order[3]]):
+                invoices.discard(order)
+            user_ids = {order[1] for order in orders}
+            transaction.on_commit(lambda user_ids=user_ids: header.invalidate(*user_ids))
+        cancelled += len(orders)
+    return cancelled
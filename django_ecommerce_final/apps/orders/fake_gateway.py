@@ -0,0 +1,148 @@
+"""
+A local stand-in for the SSLCommerz sandbox, for load-testing checkout
+without network access. Start it with ``manage.py fake_sslcommerz`` and
+point the shop at it::
+
+    SSLCOMMERZ_API_URL=http://127.0.0.1:8090/gwprocess/v4/api.php
+    SSLCOMMERZ_VALIDATION_URL=http://127.0.0.1:8090/validator/api/validationserverAPI.php
+
+It speaks the subset of the API the shop uses: session creation, a payment
+page that immediately "pays" and redirects to ``success_url`` (or to
+``fail_url`` / ``cancel_url`` with ``?outcome=fail|cancel``), and
+validation of the returned ``val_id``. Every API call can be delayed and a
+share of them made to fail, to see how the client's timeouts, retries and
+circuit breaker behave.
+"""
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+SESSION_PATH = '/gwprocess/v4/api.php'
+VALIDATION_PATH = '/validator/api/validationserverAPI.php'
+PAYMENT_PATH = '/gw/'
+FAILURES = ('error', 'timeout', 'drop')
+
+
+class FakeGatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, failure_rate=0.0, failure='error', hang=60.0):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure = failure
+        self.hang = hang
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.payments = {}
+        self.calls = 0
+        self.failures = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'FakeSSLCommerz/1.0'
+    # Keep-alive, so the shop's pooled connections are exercised
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != SESSION_PATH:
+            return self._json({'status': 'FAILED', 'failedreason': 'Unknown endpoint'}, 404)
+        length = int(self.headers.get('Content-Length') or 0)
+        form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        if self._misbehave():
+            return
+        if not form.get('store_id') or not form.get('tran_id'):
+            return self._json({'status': 'FAILED', 'failedreason': 'store_id and tran_id are required'})
+        key = uuid.uuid4().hex.upper()
+        with self.server.lock:
+            self.server.sessions[key] = form
+        self._json({
+            'status': 'SUCCESS',
+            'sessionkey': key,
+            'GatewayPageURL': f'{self.server.base_url}{PAYMENT_PATH}{key}',
+        })
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path.startswith(PAYMENT_PATH):
+            return self._pay(url.path[len(PAYMENT_PATH):], query.get('outcome', 'success'))
+        if url.path != VALIDATION_PATH:
+            return self._json({'status': 'FAILED', 'failedreason': 'Unknown endpoint'}, 404)
+        if self._misbehave():
+            return
+        with self.server.lock:
+            payment = self.server.payments.get(query.get('val_id'))
+        if not payment:
+            return self._json({'status': 'INVALID_TRANSACTION'})
+        self._json({
+            'status': 'VALID',
+            'val_id': query['val_id'],
+            'tran_id': payment['tran_id'],
+            'amount': payment.get('total_amount'),
+            'currency': payment.get('currency', 'BDT'),
+        })
+
+    def _pay(self, key, outcome):
+        with self.server.lock:
+            session = self.server.sessions.get(key)
+        if not session:
+            return self._json({'status': 'FAILED', 'failedreason': 'Unknown session'}, 404)
+        params = {'tran_id': session['tran_id']}
+        if outcome == 'success':
+            val_id = uuid.uuid4().hex
+            with self.server.lock:
+                self.server.payments[val_id] = session
+            params['val_id'] = val_id
+        target = session.get(f'{outcome}_url') or session['fail_url']
+        self.send_response(302)
+        self.send_header('Location', f'{target}?{urlencode(params)}')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _misbehave(self):
+        """Apply the configured latency; True when this call was made to fail."""
+        server = self.server
+        time.sleep(max(server.latency + random.uniform(-server.jitter, server.jitter), 0))
+        with server.lock:
+            server.calls += 1
+            failing = random.random() < server.failure_rate
+            server.failures += failing
+        if not failing:
+            return False
+        if server.failure == 'timeout':
+            time.sleep(server.hang)
+            try:
+                self._json({'status': 'FAILED', 'failedreason': 'Too slow'})
+            except ConnectionError:
+                # The client gave up waiting, as it should
+                pass
+        elif server.failure == 'drop':
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+        else:
+            self._json({'status': 'FAILED', 'failedreason': 'Internal error'}, 500)
+        return True
+
+    def _json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,166 @@
+"""
+SSLCommerz client.
+
+One client per process keeps a pooled ``requests.Session``, so calls reuse
+TLS connections instead of opening new ones. Every call has connect and
+read timeouts, so a slow gateway costs a worker seconds rather than
+minutes. Failed calls are retried, but only within a retry budget: retries
+may add at most ``RETRY_RATIO`` of the calls made, so an outage does not
+multiply the load on the gateway. After ``SSLCOMMERZ_BREAKER_FAILURES``
+failures in a row the circuit breaker opens and calls fail immediately
+until the cooldown has passed. Then one trial call decides whether it
+closes again.
+"""
+import threading
+import time
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+POOL_SIZE = 20
+RETRY_RATIO = 0.2
+RETRY_BACKOFF = 0.2
+
+
+class GatewayError(Exception):
+    """The gateway could not be reached or gave an unusable answer."""
+
+
+class GatewayUnavailable(GatewayError):
+    """The circuit breaker is open; the gateway was not called."""
+
+
+class CircuitBreaker:
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self._opened_at >= self.cooldown:
+                # Half open: let one call through to probe the gateway
+                self._trial = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            self._trial = False
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+            else:
+                self._failures += 1
+                if self._failures >= self.threshold:
+                    self._opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Retries earn ``ratio`` of a token per call made; each retry spends one."""
+
+    def __init__(self, ratio, minimum=3):
+        self.ratio = ratio
+        self.maximum = minimum + 10
+        self._lock = threading.Lock()
+        self._tokens = float(minimum)
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.maximum)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class SSLCommerzClient:
+    def __init__(self, store_id, store_pass, session_url, validation_url,
+                 timeout=(3.05, 10), retries=2, breaker=None):
+        self.store_id = store_id
+        self.store_pass = store_pass
+        self.session_url = session_url
+        self.validation_url = validation_url
+        self.timeout = timeout
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker(5, 30)
+        self.budget = RetryBudget(RETRY_RATIO)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def create_session(self, post_body):
+        """Start a payment; returns the gateway's JSON (``status``, ``sessionkey``, ``GatewayPageURL`` ...)."""
+        data = {**post_body, 'store_id': self.store_id, 'store_passwd': self.store_pass}
+        return self._call('POST', self.session_url, data=data)
+
+    def validate(self, val_id):
+        """Look up a payment by the ``val_id`` the gateway redirected back with."""
+        params = {'val_id': val_id, 'store_id': self.store_id, 'store_passwd': self.store_pass, 'format': 'json'}
+        return self._call('GET', self.validation_url, params=params)
+
+    def _call(self, method, url, **kwargs):
+        if not self.breaker.allow():
+            raise GatewayUnavailable('Payment gateway is unavailable, please try again shortly.')
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                if response.status_code >= 500:
+                    raise GatewayError(f'Payment gateway answered {response.status_code}')
+                result = response.json()
+                self.breaker.record(True)
+                return result
+            except (requests.RequestException, ValueError, GatewayError) as e:
+                if attempt < self.retries and self._retryable(method, e) and self.budget.withdraw():
+                    attempt += 1
+                    time.sleep(RETRY_BACKOFF * attempt)
+                    continue
+                self.breaker.record(False)
+                if isinstance(e, GatewayError):
+                    raise
+                raise GatewayError(f'Payment gateway error: {e}') from e
+
+    @staticmethod
+    def _retryable(method, error):
+        if method == 'GET':
+            return True
+        # A POST may have reached the gateway unless the connection never
+        # opened; retrying it then could start a second payment session
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], 'reason', None) if isinstance(error, requests.ConnectionError) and error.args else None
+        return isinstance(reason, NewConnectionError)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide client, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SSLCommerzClient(
+                    settings.SSLCOMMERZ_STORE_ID,
+                    settings.SSLCOMMERZ_STORE_PASS,
+                    settings.SSLCOMMERZ_API_URL,
+                    settings.SSLCOMMERZ_VALIDATION_URL,
+                    timeout=(settings.SSLCOMMERZ_CONNECT_TIMEOUT, settings.SSLCOMMERZ_READ_TIMEOUT),
+                    retries=settings.SSLCOMMERZ_RETRIES,
+                    breaker=CircuitBreaker(settings.SSLCOMMERZ_BREAKER_FAILURES, settings.SSLCOMMERZ_BREAKER_COOLDOWN),
+                )
+    return _client
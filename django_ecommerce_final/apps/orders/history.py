@@ -0,0 +1,42 @@
+"""
+Order history listings.
+
+Customers with hundreds of orders get them a page at a time, keyset
+paginated so a deep page costs as much as the first. The item count and
+whether the order can still be paid are annotated in SQL, so rendering a
+page runs a fixed number of queries: the page itself and the prefetch of
+its items.
+"""
+from django.db.models import BooleanField, Case, Count, Q, Value, When
+from django.utils import timezone
+from apps.store.pagination import paginate_keyset
+
+ORDERS_PER_PAGE = 10
+
+
+def payable_filter(now):
+    return Q(
+        status__in=('pending', 'failed'),
+        payment_method='sslcommerz',
+        payment_timeout__gt=now,
+    )
+
+
+def annotate(queryset, now=None):
+    """Add ``item_count`` and ``show_pay_now`` to every order."""
+    return queryset.annotate(
+        item_count=Count('orderitem'),
+        show_pay_now=Case(
+            When(payable_filter(now or timezone.now()), then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ),
+    )
+
+
+def page(queryset, cursor=None, field='created_at', descending=True, per_page=ORDERS_PER_PAGE, items=True):
+    """One annotated page of orders after ``cursor``; returns ``(orders, next_cursor)``."""
+    queryset = annotate(queryset)
+    if items:
+        queryset = queryset.prefetch_related('orderitem_set__product')
+    return paginate_keyset(queryset, field, descending, cursor, per_page)
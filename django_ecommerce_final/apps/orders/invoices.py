@@ -0,0 +1,228 @@
+"""
+Pre-rendered invoice PDFs.
+
+Running ``pisa.CreatePDF`` costs hundreds of milliseconds of CPU, so a
+completed order's invoice is rendered once, in a background thread right
+after the order is saved, and stored under ``MEDIA_ROOT/invoices/`` as
+``Invoice_<order number>_<hash>.pdf``, the hash being that of the invoice
+HTML. Every later save of the order re-renders only the HTML: an unchanged
+hash keeps the file, a changed one replaces it. A PDF is written to a
+temporary file and renamed into place, so concurrent renders of the same
+invoice never leave a partial file or a renamed copy.
+
+The invoice view streams the stored file with an ETag (the hash, read back
+from the file name) and byte-range support, without rendering anything. An
+order whose file is not there yet gets it scheduled and a retry response;
+only when the background render failed does a request render it, to show
+the error.
+"""
+import hashlib
+import io
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.http import FileResponse, HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from xhtml2pdf import pisa
+
+TEMPLATE = 'orders/invoice_pdf.html'
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='invoices')
+_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# How long a failed background render sends requests to render in-line
+FAILED_TIMEOUT = 60 * 60
+
+
+class InvoiceError(Exception):
+    """xhtml2pdf could not render the invoice; ``html`` is what it was given."""
+
+    def __init__(self, err, html):
+        self.html = html
+        super().__init__(f'Error generating PDF: {err}')
+
+
+def render_html(order):
+    from django.contrib.humanize.templatetags.humanize import intcomma
+
+    # Pre-format numeric values to strings to avoid template rendering issues in PDF engine
+    items = list(order.orderitem_set.all())
+    for item in items:
+        item.formatted_price = intcomma(item.price)
+        item.formatted_total = intcomma(item.get_total_price())
+
+    return render_to_string(TEMPLATE, {
+        'order': order,
+        'items': items,
+        'subtotal': intcomma(order.get_subtotal()),
+        'shipping': intcomma(order.shipping_charge),
+        'total': intcomma(order.total),
+        'logo_path': os.path.join(settings.BASE_DIR, 'static', 'images', 'icon.gif'),
+    })
+
+
+def render_pdf(html):
+    pdf = io.BytesIO()
+    status = pisa.CreatePDF(html, dest=pdf, encoding='utf-8')
+    if status.err:
+        raise InvoiceError(status.err, html)
+    return pdf.getvalue()
+
+
+def _digest(html):
+    return hashlib.sha256(html.encode()).hexdigest()[:16]
+
+
+def invoice_name(order, html):
+    return f'invoices/Invoice_{order.order_number}_{_digest(html)}.pdf'
+
+
+def etag(html):
+    return '"%s"' % _digest(html)
+
+
+def _name_etag(name):
+    # invoice_name() ends the file name with the digest
+    return '"%s"' % os.path.splitext(os.path.basename(name))[0].rsplit('_', 1)[-1]
+
+
+def _failed_key(order_id):
+    return f'invoice-failed:{order_id}'
+
+
+def write_pdf(name, html, overwrite=False):
+    """Render ``html`` into the file ``name`` unless it is already there. Needs no database."""
+    if overwrite or not default_storage.exists(name):
+        pdf = render_pdf(html)
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(pdf)
+            os.chmod(temp, default_storage.file_permissions_mode or 0o644)
+            os.replace(temp, path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+    return name
+
+
+def attach(order, name):
+    """Point the order at its invoice file ``name`` and delete the one it replaces."""
+    from .models import Order
+
+    old = order.invoice.name if order.invoice else None
+    if old != name:
+        # update() keeps this out of the post_save signal that scheduled it
+        Order.objects.filter(pk=order.pk).update(invoice=name)
+        order.invoice.name = name
+        if old:
+            default_storage.delete(old)
+
+
+def build(order):
+    """
+    Store the order's current invoice, rendering the PDF only if its HTML
+    changed. Returns the file name and its ETag.
+    """
+    html = render_html(order)
+    name = write_pdf(invoice_name(order, html), html)
+    attach(order, name)
+    return name, etag(html)
+
+
+def stored(order):
+    """``(name, etag)`` of the order's stored invoice, or None while it has none on disk."""
+    if order.invoice and default_storage.exists(order.invoice.name):
+        return order.invoice.name, _name_etag(order.invoice.name)
+    return None
+
+
+def render_failed(order):
+    """True when the last background render of the order's invoice raised ``InvoiceError``."""
+    return bool(cache.get(_failed_key(order.pk)))
+
+
+def discard(order):
+    from .models import Order
+
+    if order.invoice:
+        default_storage.delete(order.invoice.name)
+        Order.objects.filter(pk=order.pk).update(invoice=None)
+        order.invoice.name = None
+
+
+def _run(order_id):
+    from .models import Order
+
+    try:
+        order = Order.objects.filter(pk=order_id, status='completed').prefetch_related('orderitem_set__product').first()
+        if order:
+            build(order)
+        cache.delete(_failed_key(order_id))
+    except InvoiceError:
+        # The view renders it again on demand and shows the error there
+        cache.set(_failed_key(order_id), True, FAILED_TIMEOUT)
+    finally:
+        connection.close()
+
+
+def schedule(order):
+    """Render the invoice in the background once the current transaction commits."""
+    order_id = order.pk
+    transaction.on_commit(lambda: _executor.submit(_run, order_id))
+
+
+def serve(request, name, filename, tag):
+    """Stream the stored invoice ``name`` tagged ``tag``; answers If-None-Match with 304 and Range with 206."""
+    response = get_conditional_response(request, etag=tag)
+    if response is None:
+        size = default_storage.size(name)
+        byte_range = _parse_range(request, tag, size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif byte_range:
+            start, end = byte_range
+            with default_storage.open(name, 'rb') as invoice:
+                invoice.seek(start)
+                response = HttpResponse(invoice.read(end - start + 1), status=206, content_type='application/pdf')
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            response = FileResponse(default_storage.open(name, 'rb'), content_type='application/pdf')
+        response['Content-Disposition'] = f'inline; filename="{filename}"'
+    response['ETag'] = tag
+    response['Accept-Ranges'] = 'bytes'
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _parse_range(request, tag, size):
+    """``(start, end)`` for a satisfiable single range, None to send everything, False if unsatisfiable."""
+    header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not header or (if_range and if_range != tag):
+        return None
+    match = _range_re.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Multiple or malformed ranges: the whole file is a valid answer
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            return False
+    else:
+        # Suffix range: the last N bytes
+        if int(last) == 0:
+            return False
+        start, end = max(size - int(last), 0), size - 1
+    return start, end
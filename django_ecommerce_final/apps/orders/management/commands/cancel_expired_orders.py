@@ -1,33 +1,23 @@
+import time
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from apps.orders.models import Order
+from apps.orders.expiry import cancel_expired
 
 
 class Command(BaseCommand):
-    help = 'Cancel orders that have expired payment timeout'
+    help = 'Cancel orders that have expired payment timeout and return their stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders cancelled per transaction')
+        parser.add_argument('--loop', action='store_true', help='Keep running, sweeping every --interval seconds')
+        parser.add_argument('--interval', type=float, default=15.0, help='Seconds between sweeps with --loop')
 
     def handle(self, *args, **options):
-        now = timezone.now()
-        
-        # Find pending SSL Commerce orders that have expired
-        expired_orders = Order.objects.filter(
-            status='pending',
-            payment_method='sslcommerz',
-            payment_timeout__lt=now
-        )
-        
-        cancelled_count = 0
-        for order in expired_orders:
-            order.status = 'cancelled'
-            order.save()
-            cancelled_count += 1
-            self.stdout.write(
-                self.style.SUCCESS(f'Cancelled order #{order.order_number} (expired at {order.payment_timeout})')
-            )
-        
-        if cancelled_count == 0:
-            self.stdout.write('No expired orders found.')
-        else:
-            self.stdout.write(
-                self.style.SUCCESS(f'Successfully cancelled {cancelled_count} expired order(s).')
-            )
\ No newline at end of file
+        while True:
+            cancelled = cancel_expired(batch_size=options['batch_size'])
+            if cancelled:
+                self.stdout.write(self.style.SUCCESS(f'Successfully cancelled {cancelled} expired order(s).'))
+            elif not options['loop']:
+                self.stdout.write('No expired orders found.')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
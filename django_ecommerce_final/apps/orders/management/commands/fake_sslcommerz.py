@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from apps.orders.fake_gateway import FAILURES, SESSION_PATH, VALIDATION_PATH, FakeGatewayServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local SSLCommerz stand-in with configurable latency and failures, for load-testing checkout offline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8090)
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every API call')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Random +/- seconds on top of the latency')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of API calls that fail (0-1)')
+        parser.add_argument('--failure', choices=FAILURES, default='error',
+                            help='How calls fail: HTTP 500, hang past the client timeout, or drop the connection')
+        parser.add_argument('--hang', type=float, default=60.0, help="Seconds a 'timeout' failure hangs")
+
+    def handle(self, *args, **options):
+        server = FakeGatewayServer(
+            (options['host'], options['port']),
+            latency=options['latency'],
+            jitter=options['jitter'],
+            failure_rate=options['failure_rate'],
+            failure=options['failure'],
+            hang=options['hang'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Fake SSLCommerz listening on {server.base_url}'))
+        self.stdout.write('Run the shop with:')
+        self.stdout.write(f'  SSLCOMMERZ_API_URL={server.base_url}{SESSION_PATH}')
+        self.stdout.write(f'  SSLCOMMERZ_VALIDATION_URL={server.base_url}{VALIDATION_PATH}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'{server.calls} API call(s), {server.failures} failed on purpose.')
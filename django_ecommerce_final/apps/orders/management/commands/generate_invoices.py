@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, time as day_time
+import django
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.orders import invoices
+from apps.orders.models import Order
+
+
+def _parse_day(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD.')
+
+
+class Command(BaseCommand):
+    help = ('Generate invoice PDFs in parallel for completed orders in a date range; '
+            'rerunning skips invoices that are already current')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='First order date (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Last order date (YYYY-MM-DD), inclusive')
+        parser.add_argument('--workers', type=int, default=None, help='Rendering processes (default: one per CPU)')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Orders fetched per query')
+        parser.add_argument('--start-id', type=int, default=0, help='Resume after this order id')
+        parser.add_argument('--force', action='store_true', help='Render again even when the stored invoice is current')
+
+    def handle(self, *args, **options):
+        # Only completed orders keep a stored invoice; anything else would be discarded by its next save
+        orders = Order.objects.filter(pk__gt=options['start_id'], status='completed')
+        tz = timezone.get_current_timezone()
+        if options['date_from']:
+            orders = orders.filter(created_at__gte=datetime.combine(_parse_day(options['date_from']), day_time.min, tz))
+        if options['date_to']:
+            orders = orders.filter(created_at__lte=datetime.combine(_parse_day(options['date_to']), day_time.max, tz))
+        total = orders.count()
+        self.stdout.write(f'{total} order(s) to check.')
+
+        workers = options['workers'] or os.cpu_count()
+        done = rendered = failed = last_seen = 0
+        started = time.perf_counter()
+        pending = {}
+
+        def report():
+            if done % 100 and done != total:
+                return
+            # Every order before the oldest one still rendering is finished
+            resume_id = min(o.pk for o in pending.values()) - 1 if pending else last_seen
+            self.stdout.write(f'{done}/{total} ({rendered} rendered, {failed} failed, '
+                              f'{done / (time.perf_counter() - started):.1f}/s), resume with --start-id {resume_id}')
+
+        def collect(futures):
+            nonlocal done, rendered, failed
+            for future in futures:
+                order = pending.pop(future)
+                try:
+                    invoices.attach(order, future.result())
+                    rendered += 1
+                except invoices.InvoiceError as e:
+                    failed += 1
+                    self.stderr.write(f'Order #{order.order_number}: {e}')
+                done += 1
+                report()
+
+        # Spawned rather than forked so no worker inherits the open database connection
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+            queryset = orders.order_by('pk').prefetch_related('orderitem_set__product')
+            for order in queryset.iterator(chunk_size=options['chunk_size']):
+                last_seen = order.pk
+                html = invoices.render_html(order)
+                name = invoices.invoice_name(order, html)
+                if not options['force'] and order.invoice and order.invoice.name == name and default_storage.exists(name):
+                    done += 1
+                    report()
+                    continue
+                # Only the PDF conversion, the expensive part, runs in the pool
+                pending[pool.submit(invoices.write_pdf, name, html, options['force'])] = order
+                if len(pending) >= workers * 4:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+            collect(list(pending))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} invoice(s), {done - rendered - failed} already current, {failed} failed '
+            f'in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from apps.orders.payments import process_pending
+
+
+class Command(BaseCommand):
+    help = 'Apply recorded payment callbacks (IPNs and redirects still pending validation)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Events applied per transaction')
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for new events')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            applied = process_pending(batch_size=options['batch_size'])
+            if applied or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Applied {applied} payment event(s).'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from apps.orders.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Release stock held by orders whose payment window has closed; run from cron'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Holds released per transaction')
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservation(s).'))
@@ -0,0 +1,79 @@
+import tempfile
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+
+
+class Command(BaseCommand):
+    help = 'Place orders from parallel threads against a throwaway SQLite database (WAL mode) and check every order number is unique'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000, help='Orders to place in total')
+        parser.add_argument('--threads', type=int, default=16, help='Threads placing orders concurrently')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The stress test runs against SQLite only.')
+
+        total, threads = options['orders'], options['threads']
+        # A file database (not the in-memory default) so every thread shares it
+        workdir = tempfile.TemporaryDirectory()
+        old_test = connection.settings_dict['TEST']
+        connection.settings_dict['TEST'] = {**old_test, 'NAME': f'{workdir.name}/stress.sqlite3'}
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        old_options = connection.settings_dict.get('OPTIONS', {})
+        connection.settings_dict['OPTIONS'] = {**old_options, 'timeout': 60}
+        try:
+            self.stdout.write(f'Placing {total} orders from {threads} threads...')
+            elapsed, errors = self._run(total, threads)
+            self._report(total, elapsed, errors)
+        finally:
+            connection.settings_dict['OPTIONS'] = old_options
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            connection.settings_dict['TEST'] = old_test
+            workdir.cleanup()
+
+    def _run(self, total, threads):
+        from django.contrib.auth.models import User
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        user = User.objects.create_user('stress-test')
+        counts = [total // threads + (i < total % threads) for i in range(threads)]
+        errors = []
+        start = threading.Barrier(threads)
+
+        def worker(count):
+            from apps.orders.models import Order
+            start.wait()
+            try:
+                for _ in range(count):
+                    with transaction.atomic():
+                        Order.objects.create(user=user, total=1, payment_method='cod')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(count,)) for count in counts]
+        began = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return time.perf_counter() - began, errors
+
+    def _report(self, total, elapsed, errors):
+        from apps.orders.models import Order, OrderNumberSequence
+
+        numbers = list(Order.objects.values_list('order_number', flat=True))
+        issued = sum(OrderNumberSequence.objects.values_list('last_value', flat=True))
+        self.stdout.write(f'{len(numbers)} orders in {elapsed:.2f}s ({len(numbers) / elapsed:.0f}/s), '
+                          f'{len(set(numbers))} distinct numbers, {issued} numbers issued '
+                          f'(days: {", ".join(str(d) for d in OrderNumberSequence.objects.values_list("day", flat=True))})')
+        for error in errors[:5]:
+            self.stderr.write(f'{type(error).__name__}: {error}')
+        if errors or len(numbers) != total or len(set(numbers)) != total or issued != total:
+            raise CommandError(f'Stress test failed ({len(errors)} thread error(s)).')
+        self.stdout.write(self.style.SUCCESS(f'All {total} order numbers are unique and gapless.'))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_ordernumbersequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='invoice',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='invoices/'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_order_invoice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ipn', 'IPN'), ('success', 'Success redirect'), ('fail', 'Fail redirect'), ('cancel', 'Cancel redirect')], max_length=20)),
+                ('dedupe_key', models.CharField(max_length=255, unique=True)),
+                ('tran_id', models.CharField(blank=True, max_length=255)),
+                ('val_id', models.CharField(blank=True, max_length=255)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('outcome', models.CharField(blank=True, max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_events', to='orders.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['processed_at', 'id'], name='orders_paym_process_ecc92a_idx')],
+            },
+        ),
+    ]
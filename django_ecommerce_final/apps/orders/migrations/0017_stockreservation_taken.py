@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0016_order_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockreservation',
+            name='taken',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,7 @@
 
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.utils import timezone
 from apps.store.models import Product
@@ -16,6 +18,19 @@ PAYMENT_METHOD_CHOICES = [
     ('cod', 'Cash on Delivery'),
 ]
 
+RESERVATION_STATUS_CHOICES = [
+    ('active', 'Active'),
+    ('converted', 'Converted'),
+    ('released', 'Released'),
+]
+
+PAYMENT_EVENT_KINDS = [
+    ('ipn', 'IPN'),
+    ('success', 'Success redirect'),
+    ('fail', 'Fail redirect'),
+    ('cancel', 'Cancel redirect'),
+]
+
 DELIVERY_STATUS_CHOICES = [
     ('pending', 'Pending'),
     ('processing', 'Processing'),
@@ -46,9 +61,23 @@ class Order(models.Model):
  
  transaction_id=models.CharField(max_length=255, blank=True, null=True, unique=True)
  payment_timeout=models.DateTimeField(blank=True, null=True)
+ # Rendered PDF of a completed order, kept current by apps.orders.invoices
+ invoice=models.FileField(upload_to='invoices/', blank=True, null=True, editable=False)
  created_at=models.DateTimeField(auto_now_add=True)
  updated_at=models.DateTimeField(auto_now=True)
 
+ @classmethod
+ def from_db(cls, db, field_names, values):
+  instance = super().from_db(db, field_names, values)
+  # Remembered so saving can tell a status transition from any other edit
+  instance._saved_statuses = (instance.__dict__.get('status'), instance.__dict__.get('delivery_status'))
+  return instance
+
+ @property
+ def status_changed(self):
+  """True when status or delivery_status differ from what was last loaded or saved"""
+  return getattr(self, '_saved_statuses', None) != (self.status, self.delivery_status)
+
  def save(self, *args, **kwargs):
   if not self.order_number:
    self.order_number = self.generate_order_number()
@@ -57,14 +86,22 @@ class Order(models.Model):
   if self.payment_method == 'sslcommerz' and not self.payment_timeout:
    self.payment_timeout = timezone.now() + timezone.timedelta(minutes=30)
    
-  super().save(*args, **kwargs)
+  # Atomic so the post_save timeline entry commits with the transition
+  with transaction.atomic():
+   super().save(*args, **kwargs)
+  self._saved_statuses = (self.status, self.delivery_status)
  
+ @property
+ def is_payment_expired(self):
+  """Unpaid SSLCommerz order whose payment window has closed (the sweeper cancels it)"""
+  return ((self.status == 'pending' or self.status == 'failed') and 
+   self.payment_method == 'sslcommerz' and 
+   self.payment_timeout is not None and 
+   self.payment_timeout < timezone.now())
+
  def check_and_cancel_if_expired(self):
   """Check if SSLCommerz order is expired and cancel if so"""
-  if ((self.status == 'pending' or self.status == 'failed') and 
-   self.payment_method == 'sslcommerz' and 
-   self.payment_timeout and 
-   self.payment_timeout < timezone.now()):
+  if self.is_payment_expired:
    self.status = 'cancelled'
    self.delivery_status = 'cancelled'
    self.save()
@@ -77,33 +114,71 @@ class Order(models.Model):
 
  @property
  def total_items(self):
+  # Listings annotate the count (apps.orders.history) instead of a query per order
+  if hasattr(self, 'item_count'):
+   return self.item_count
   return self.orderitem_set.count()
 
+ @property
+ def minutes_remaining(self):
+  """Whole minutes left to pay, 0 once the payment window has closed"""
+  if not self.payment_timeout:
+   return 0
+  return max(int((self.payment_timeout - timezone.now()).total_seconds() / 60), 0)
+
  def generate_order_number(self):
-  """Generate order number in format: YYYYMMDDXX (date + 2-digit sequential number)"""
+  """Generate order number in format: YYYYMMDD + sequential number (ORDER_NUMBER_WIDTH digits, wider when needed)"""
   today = timezone.localtime(timezone.now()).date()
-  date_str = today.strftime('%Y%m%d')
-  
-  # Get the last order number for today
-  last_order = Order.objects.filter(
-   order_number__startswith=date_str
-  ).order_by('-order_number').first()
-  
-  if last_order:
-   # Extract the sequential number and increment
-   last_num = int(last_order.order_number[-2:])
-   new_num = last_num + 1
-  else:
-   new_num = 1
-  
-  return f"{date_str}{new_num:02d}"
+  number = OrderNumberSequence.next_value(today)
+  return f"{today.strftime('%Y%m%d')}{number:0{settings.ORDER_NUMBER_WIDTH}d}"
 
  class Meta:
   ordering = ['-created_at']
+  indexes=[
+   # Keyset pages of a customer's order history and pending payments
+   models.Index(fields=['user', '-created_at', '-id']),
+   models.Index(fields=['user', 'payment_timeout', 'id']),
+  ]
 
  def __str__(self):
   return f"Order #{self.order_number} - {self.user.username}"
 
+class OrderNumberSequence(models.Model):
+ """Last order number handed out per day; one row per day, bumped atomically"""
+ day=models.DateField(unique=True)
+ last_value=models.PositiveIntegerField(default=0)
+
+ @classmethod
+ def next_value(cls, day):
+  """
+  Allocate the next number of ``day``.
+
+  The counter is bumped with an UPDATE, which locks the day's row until the
+  surrounding transaction ends, so concurrent checkouts queue on it instead
+  of reading the same "last" order. A rolled back order rolls its number
+  back too, leaving no gap.
+  """
+  with transaction.atomic():
+   if not cls.objects.filter(day=day).update(last_value=F('last_value') + 1):
+    try:
+     with transaction.atomic():
+      cls.objects.create(day=day, last_value=cls._last_issued(day) + 1)
+    except IntegrityError:
+     # Another checkout created the day's row first
+     cls.objects.filter(day=day).update(last_value=F('last_value') + 1)
+   return cls.objects.filter(day=day).values_list('last_value', flat=True).get()
+
+ @staticmethod
+ def _last_issued(day):
+  # Only for a day's first number: continue after orders numbered before
+  # the counter existed
+  prefix = day.strftime('%Y%m%d')
+  numbers = Order.objects.filter(order_number__startswith=prefix).values_list('order_number', flat=True)
+  return max((int(number[len(prefix):]) for number in numbers if number[len(prefix):].isdigit()), default=0)
+
+ def __str__(self):
+  return f"{self.day}: {self.last_value}"
+
 class OrderItem(models.Model):
  order=models.ForeignKey(Order, on_delete=models.CASCADE)
  product=models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -115,3 +190,62 @@ class OrderItem(models.Model):
 
  def __str__(self):
   return f"{self.product.name} x {self.quantity}"
+
+class StockReservation(models.Model):
+ """Stock held for an order until it is paid (converted) or expires (released)"""
+ order=models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+ product=models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+ quantity=models.PositiveIntegerField()
+ # Units actually taken from stock on conversion; a lapsed hold may get fewer than its quantity
+ taken=models.PositiveIntegerField(blank=True, null=True)
+ status=models.CharField(max_length=20, choices=RESERVATION_STATUS_CHOICES, default='active')
+ expires_at=models.DateTimeField(blank=True, null=True)
+ created_at=models.DateTimeField(auto_now_add=True)
+
+ class Meta:
+  indexes=[
+   # The sweeper's scan for lapsed holds
+   models.Index(fields=['status', 'expires_at']),
+  ]
+
+ def __str__(self):
+  return f"{self.quantity} x {self.product_id} for order {self.order_id} ({self.status})"
+
+class OrderEvent(models.Model):
+ """One status transition of an order, for its tracking timeline"""
+ order=models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+ status=models.CharField(max_length=20, choices=ORDER_STATUS_CHOICES)
+ delivery_status=models.CharField(max_length=20, choices=DELIVERY_STATUS_CHOICES)
+ created_at=models.DateTimeField(default=timezone.now)
+
+ class Meta:
+  ordering = ['created_at', 'id']
+  indexes=[
+   models.Index(fields=['order', 'created_at']),
+  ]
+
+ def __str__(self):
+  return f"Order {self.order_id}: {self.status}/{self.delivery_status} at {self.created_at}"
+
+class PaymentEvent(models.Model):
+ """A gateway callback, stored once per dedupe_key and applied by apps.orders.payments"""
+ kind=models.CharField(max_length=20, choices=PAYMENT_EVENT_KINDS)
+ dedupe_key=models.CharField(max_length=255, unique=True)
+ order=models.ForeignKey(Order, on_delete=models.SET_NULL, blank=True, null=True, related_name='payment_events')
+ tran_id=models.CharField(max_length=255, blank=True)
+ val_id=models.CharField(max_length=255, blank=True)
+ payload=models.JSONField(default=dict, blank=True)
+ # What applying it did: completed, failed, cancelled, ignored or invalid
+ outcome=models.CharField(max_length=20, blank=True)
+ attempts=models.PositiveIntegerField(default=0)
+ received_at=models.DateTimeField(auto_now_add=True)
+ processed_at=models.DateTimeField(blank=True, null=True)
+
+ class Meta:
+  indexes=[
+   # The worker's scan for unprocessed events
+   models.Index(fields=['processed_at', 'id']),
+  ]
+
+ def __str__(self):
+  return f"{self.kind} {self.val_id or self.tran_id} ({self.outcome or 'pending'})"
@@ -0,0 +1,143 @@
+"""
+Payment callbacks as idempotent events.
+
+Every gateway callback (IPN, or the customer's success/fail/cancel
+redirect) is first stored as a ``PaymentEvent``. Its ``dedupe_key`` is
+unique, so a retried IPN or a reloaded redirect finds the existing row and
+changes nothing; a new payment attempt on the same order gets a new key.
+Success redirects and IPNs only complete an order once the gateway's
+validation API confirms their ``val_id``. IPNs are acknowledged as soon
+as they are stored, and ``process_pending``
+(``manage.py process_payment_events``) applies them in batches. Redirects
+are applied right away through the same ``process``, because the customer
+is waiting for the result.
+
+Applying an event locks its order row, so an IPN and a redirect for the
+same payment cannot both act on it.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from . import gateway
+from .models import Order, PaymentEvent
+
+VALID_STATUSES = ('VALID', 'VALIDATED')
+
+
+def order_id_from_tran_id(tran_id):
+    """Order id from a ``ORDER_<order id>_<user id>`` transaction id, or None."""
+    try:
+        return int(tran_id.split('_')[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def record(kind, data):
+    """Store a callback (``data`` is its POST/GET parameters) once; returns the event."""
+    tran_id = data.get('tran_id') or ''
+    val_id = data.get('val_id') or ''
+    status = data.get('status') or ''
+    order = Order.objects.filter(pk=order_id_from_tran_id(tran_id)).values_list('pk', 'transaction_id').first()
+    order_id, session = order or (None, '')
+    # Without a val_id (fail/cancel), the attempt's gateway session tells a retry from a reload
+    attempt = val_id or f'{tran_id}:{data.get("sessionkey") or session or ""}'
+    event, _ = PaymentEvent.objects.get_or_create(
+        dedupe_key=f'{kind}:{attempt}:{status}',
+        defaults={
+            'kind': kind,
+            'tran_id': tran_id,
+            'val_id': val_id,
+            'payload': dict(data),
+            'order_id': order_id,
+        },
+    )
+    return event
+
+
+def _needs_validation(event):
+    return event.kind in ('success', 'ipn') and event.val_id and 'validation' not in event.payload
+
+
+def _validate(events):
+    # Ask the gateway what a val_id stands for rather than trusting the
+    # callback's own fields. Done before taking any lock, as it is a network call.
+    for event in events:
+        if not _needs_validation(event):
+            continue
+        try:
+            event.payload['validation'] = gateway.get_client().validate(event.val_id)
+        except gateway.GatewayError:
+            continue
+        event.tran_id = event.payload['validation'].get('tran_id') or ''
+        order_id = order_id_from_tran_id(event.tran_id)
+        event.order_id = order_id if Order.objects.filter(pk=order_id).exists() else None
+        PaymentEvent.objects.filter(pk=event.pk).update(
+            payload=event.payload, tran_id=event.tran_id, order_id=event.order_id,
+        )
+
+
+def _apply(event, order):
+    if order is None:
+        return 'invalid'
+
+    if event.kind in ('success', 'ipn'):
+        if event.payload.get('validation', {}).get('status') not in VALID_STATUSES:
+            return 'invalid'
+        if order.status == 'completed':
+            return 'ignored'
+        order.status = 'completed'
+        order.transaction_id = event.tran_id
+        order.save()
+        return 'completed'
+
+    # fail / cancel: the customer may retry within the payment window
+    if order.status == 'completed':
+        # A late failure must not undo a payment
+        return 'ignored'
+    if order.check_and_cancel_if_expired() or order.status == 'cancelled':
+        return 'cancelled'
+    order.status = 'failed'
+    order.save()
+    return 'failed'
+
+
+def process(events):
+    """
+    Apply unprocessed ``events``; events already processed (or being
+    processed by another worker) are skipped. Success redirects and IPNs
+    whose validation failed stay pending for the next run.
+    """
+    _validate(events)
+    ready = [event.pk for event in events if not _needs_validation(event)]
+    stuck = [event.pk for event in events if event.pk not in ready]
+    if stuck:
+        # Counted so events stuck on an unreachable gateway stand out
+        PaymentEvent.objects.filter(pk__in=stuck).update(attempts=F('attempts') + 1)
+    if not ready:
+        return 0
+    now = timezone.now()
+    with transaction.atomic():
+        locked = list(
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(pk__in=ready, processed_at__isnull=True).order_by('id')
+        )
+        order_ids = sorted({event.order_id for event in locked if event.order_id})
+        orders = {order.pk: order for order in Order.objects.select_for_update().filter(pk__in=order_ids).order_by('id')}
+        for event in locked:
+            event.outcome = _apply(event, orders.get(event.order_id))
+            event.processed_at = now
+            event.attempts += 1
+        PaymentEvent.objects.bulk_update(locked, ['outcome', 'processed_at', 'attempts'])
+    return len(locked)
+
+
+def process_pending(batch_size=100):
+    """Apply every unprocessed event, a batch per transaction. Returns the number applied."""
+    applied = 0
+    last_id = 0
+    while True:
+        batch = list(PaymentEvent.objects.filter(processed_at__isnull=True, pk__gt=last_id).order_by('id')[:batch_size])
+        if not batch:
+            return applied
+        applied += process(batch)
+        last_id = batch[-1].pk
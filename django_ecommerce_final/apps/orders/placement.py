@@ -0,0 +1,31 @@
+"""
+Order placement.
+
+An order, its items and its stock holds are written in one transaction:
+the items with a single ``bulk_create`` and the holds with one conditional
+UPDATE for all products (see ``reservations.reserve``). If any product runs
+short, nothing is kept.
+"""
+from django.db import transaction
+from .models import Order, OrderItem
+from .reservations import convert_order, reserve
+
+
+def place_order(user, lines, **fields):
+    """
+    Create an order for ``lines`` (priced ``CartLine`` objects) and hold its stock.
+
+    ``fields`` are passed to ``Order``. Cash on delivery orders have nothing
+    to wait for, so their holds are converted to sold stock right away.
+    Raises ``InsufficientStock`` when a product cannot cover its line.
+    """
+    with transaction.atomic():
+        order = Order.objects.create(user=user, **fields)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=line.product, quantity=line.qty, price=line.price)
+            for line in lines
+        ])
+        reserve(order, {line.product.id: line.qty for line in lines}, expires_at=order.payment_timeout)
+        if order.payment_method == 'cod':
+            convert_order(order)
+    return order
@@ -0,0 +1,238 @@
+"""
+Time-limited stock holds for orders.
+
+Placing an order reserves its quantities: ``Product.reserved`` is raised by
+one conditional UPDATE that only matches while ``stock - reserved`` still
+covers each quantity, so concurrent buyers of the same product can never
+oversubscribe it, and nobody has to lock or re-read the row. Available
+stock is then simply ``stock - reserved``.
+
+A hold ends in one of two ways. ``convert_order`` turns it into a sale when
+the order is paid (stock and reserved drop together, and the sale goes into
+the inventory ledger). ``release_expired``, run from cron through
+``manage.py release_expired_reservations``, hands lapsed holds back in bulk
+with one UPDATE per batch; ``release_orders`` does the same for orders
+cancelled in bulk.
+"""
+from collections import Counter
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from apps.store import inventory
+from apps.store.inventory import per_product
+from apps.store.models import Product
+from .models import StockReservation
+
+LOW_STOCK_THRESHOLD = 5
+
+
+class InsufficientStock(Exception):
+    """Raised by ``reserve`` when a product cannot cover the requested quantity."""
+
+    def __init__(self, product, available):
+        self.product = product
+        self.available = available
+        if product is None:
+            # The shortfall could not be pinned on one product (stock came back meanwhile)
+            super().__init__('Some items are no longer available in the requested quantity')
+        else:
+            super().__init__(f'Only {available} units of {product} available')
+
+
+def reserve(order, quantities, expires_at=None):
+    """
+    Hold ``quantities`` (``{product_id: qty}``) for ``order`` until ``expires_at``.
+
+    Every product is held by one conditional UPDATE; when it matches fewer
+    rows than requested, a product fell short and ``InsufficientStock`` is
+    raised with nothing held. Run it inside the caller's transaction so the
+    order is rolled back with it.
+    """
+    now = timezone.now()
+    amounts = per_product(quantities)
+    try:
+        with transaction.atomic():
+            held = Product.objects.filter(
+                pk__in=quantities,
+                stock__gte=F('reserved') + amounts,
+            ).update(reserved=F('reserved') + amounts, updated_at=now)
+            if held != len(quantities):
+                raise InsufficientStock(None, 0)
+    except InsufficientStock:
+        # The partial hold is rolled back; find the product that fell short
+        products = Product.objects.in_bulk(list(quantities))
+        short = [pk for pk in sorted(quantities)
+                 if pk not in products or products[pk].available_stock < quantities[pk]]
+        product = products.get(short[0]) if short else None
+        raise InsufficientStock(product, product.available_stock if product else 0)
+
+    return StockReservation.objects.bulk_create([
+        StockReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in quantities.items()
+    ])
+
+
+def _notify_low_stock(stock_levels):
+    """Batch the out-of-stock and low-stock alerts for ``{name: new stock}``."""
+    from apps.custom_admin.models import Notification
+    from django.urls import reverse
+
+    notifications = []
+    for name, stock in stock_levels.items():
+        if stock <= 0:
+            notifications.append(Notification(
+                title="Product Out of Stock",
+                message=f"'{name}' is now out of stock.",
+                notification_type='warning',
+            ))
+        elif stock < LOW_STOCK_THRESHOLD:
+            notifications.append(Notification(
+                title=f"Low Stock Alert: {name}",
+                message=f"Only {stock} units left in stock! Please restock soon.",
+                url=reverse('custom_admin:product_list'),
+            ))
+    Notification.objects.bulk_create(notifications)
+
+
+def convert_order(order):
+    """
+    Turn the order's holds into sold stock; safe to call more than once.
+
+    Holds that already lapsed were handed back, so their quantity is taken
+    from the stock nobody else holds (a late payment is still honoured, as
+    far as stock goes). What each hold actually got is stored on it, so a
+    later cancellation returns exactly that. Each sale is recorded in the
+    inventory ledger. Returns the number of holds converted.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        holds = list(order.reservations.select_for_update().exclude(status='converted'))
+        if not holds:
+            return 0
+        sold, held = Counter(), Counter()
+        for hold in holds:
+            sold[hold.product_id] += hold.quantity
+            if hold.status == 'active':
+                held[hold.product_id] += hold.quantity
+
+        # Lock the rows so the ledger records exactly what stock gives
+        products = list(Product.objects.select_for_update().filter(pk__in=sold).values_list(
+            'pk', 'name', 'stock', 'reserved',
+        ))
+        # Active holds come out of their own reservation, lapsed ones out of what is left free
+        active_left, free_left = {}, {}
+        for pk, _, stock, reserved in products:
+            active_left[pk] = min(held[pk], max(stock, 0))
+            free_left[pk] = max(stock - reserved, 0)
+        taken, per_hold = Counter(), {}
+        for hold in holds:
+            pool = active_left if hold.status == 'active' else free_left
+            per_hold[hold.pk] = min(hold.quantity, pool[hold.product_id])
+            pool[hold.product_id] -= per_hold[hold.pk]
+            taken[hold.product_id] += per_hold[hold.pk]
+        stock_levels = {name: stock - taken[pk] for pk, name, stock, _ in products}
+
+        Product.objects.filter(pk__in=sold).update(
+            stock=F('stock') - per_product(taken),
+            reserved=F('reserved') - per_product(held),
+            updated_at=now,
+        )
+        inventory.log({pk: -quantity for pk, quantity in taken.items()}, 'sale', order)
+        StockReservation.objects.filter(pk__in=per_hold).update(status='converted', taken=per_product(per_hold))
+        _notify_low_stock(stock_levels)
+    return len(holds)
+
+
+def _taken(hold):
+    # Holds converted before ``taken`` was recorded got their full quantity
+    return hold.quantity if hold.taken is None else hold.taken
+
+
+def _release(holds, now):
+    held = Counter()
+    for hold in holds:
+        held[hold.product_id] += hold.quantity
+    Product.objects.filter(pk__in=held).update(reserved=F('reserved') - per_product(held), updated_at=now)
+    StockReservation.objects.filter(pk__in=[hold.pk for hold in holds]).update(status='released')
+
+
+def release_order(order, restock=False):
+    """
+    Hand back the active holds of a cancelled order.
+
+    With ``restock``, stock already sold to the order is returned too (as a
+    cancellation in the inventory ledger), so completing it again sells it
+    again. Returns the number of holds released.
+    """
+    with transaction.atomic():
+        holds = list(order.reservations.select_for_update().filter(
+            status__in=['active', 'converted'] if restock else ['active']
+        ))
+        active = [hold for hold in holds if hold.status == 'active']
+        if active:
+            _release(active, timezone.now())
+        sold = [hold for hold in holds if hold.status == 'converted']
+        if sold:
+            returned = Counter()
+            for hold in sold:
+                returned[hold.product_id] += _taken(hold)
+            inventory.adjust(returned, 'cancellation', order)
+            StockReservation.objects.filter(pk__in=[hold.pk for hold in sold]).update(status='released')
+    return len(holds)
+
+
+def release_orders(order_ids, now=None):
+    """
+    ``release_order(restock=True)`` for many cancelled orders at once: one
+    UPDATE for the held counters and one for the stock sold to them.
+    Returns the number of holds released.
+    """
+    from apps.store.models import StockMovement
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        holds = list(StockReservation.objects.select_for_update().filter(
+            order_id__in=order_ids, status__in=['active', 'converted'],
+        ))
+        active = [hold for hold in holds if hold.status == 'active']
+        if active:
+            _release(active, now)
+        sold = [hold for hold in holds if hold.status == 'converted']
+        if sold:
+            returned, movements = Counter(), Counter()
+            for hold in sold:
+                returned[hold.product_id] += _taken(hold)
+                movements[hold.order_id, hold.product_id] += _taken(hold)
+            Product.objects.filter(pk__in=returned).update(
+                stock=F('stock') + per_product(returned), updated_at=now,
+            )
+            StockMovement.objects.bulk_create([
+                StockMovement(product_id=product_id, quantity=quantity, reason='cancellation', order_id=order_id)
+                for (order_id, product_id), quantity in movements.items() if quantity
+            ])
+            StockReservation.objects.filter(pk__in=[hold.pk for hold in sold]).update(status='released')
+    return len(holds)
+
+
+def release_expired(now=None, batch_size=1000):
+    """
+    Release every active hold whose ``expires_at`` has passed.
+
+    Each batch is one transaction with a single UPDATE of the product
+    counters. Rows locked by a concurrent conversion are skipped and picked
+    up by the next run. Returns the number of holds released.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            holds = list(
+                StockReservation.objects.select_for_update(skip_locked=True)
+                .filter(status='active', expires_at__lte=now)
+                .order_by('id')[:batch_size]
+            )
+            if not holds:
+                break
+            _release(holds, now)
+        released += len(holds)
+    return released
@@ -1,8 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import Order, OrderItem
+from .models import Order
+from . import invoices, reservations, tracking
 from apps.custom_admin.models import Notification
 from django.urls import reverse
+from apps.store import header
 
 @receiver(post_save, sender=Order)
 def create_order_notification(sender, instance, created, **kwargs):
@@ -14,18 +16,37 @@ def create_order_notification(sender, instance, created, **kwargs):
             url=reverse('custom_admin:order_detail', kwargs={'pk': instance.pk})
         )
 
-@receiver(post_save, sender=OrderItem)
-def handle_stock_on_order_item(sender, instance, created, **kwargs):
-    if created:
-        # Decrease stock for the product
-        product = instance.product
-        product.stock -= instance.quantity
-        product.save()
-        
-        # If stock is less than 5, create a low stock notification
-        if product.stock < 5:
-            Notification.objects.create(
-                title=f"Low Stock Alert: {product.name}",
-                message=f"Only {product.stock} units left in stock! Please restock soon.",
-                url=reverse('custom_admin:product_list')
-            )
+@receiver(post_save, sender=Order)
+def record_status_event(sender, instance, created, **kwargs):
+    # Written inside Order.save's transaction, so it commits with the change
+    if created or instance.status_changed:
+        tracking.record(instance)
+
+@receiver(post_save, sender=Order)
+def settle_reservations(sender, instance, **kwargs):
+    # Paid orders keep their stock, cancelled ones give it back
+    if instance.status == 'completed':
+        reservations.convert_order(instance)
+    elif instance.status == 'cancelled':
+        reservations.release_order(instance, restock=True)
+
+@receiver(post_save, sender=Order)
+def refresh_invoice(sender, instance, **kwargs):
+    # Completed orders keep a rendered invoice; any other status has none
+    if instance.status == 'completed':
+        invoices.schedule(instance)
+    elif instance.invoice:
+        invoices.discard(instance)
+
+@receiver(pre_delete, sender=Order)
+def release_reservations_on_delete(sender, instance, **kwargs):
+    reservations.release_order(instance)
+    invoices.discard(instance)
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def refresh_header_counts(sender, instance, **kwargs):
+    # Payable orders and unread notifications are shown in the header
+    header.invalidate(instance.user_id)
@@ -0,0 +1,55 @@
+"""
+Order status timeline and the cached tracking page.
+
+Every status transition is written as an ``OrderEvent`` in the transaction
+that makes it: by the ``Order`` post_save signal for saved orders, and by
+``log`` for bulk updates that bypass it (admin bulk status, the expiry
+sweeper).
+
+Customers refresh the tracking page constantly, so ``lookup`` reads the
+order itself live, together with the id of its latest event, and serves
+the timeline from the cache under that id. Events are only ever appended,
+so a new transition, written by any process, changes the key and nothing
+has to be invalidated.
+"""
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from .models import Order, OrderEvent
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def _cache_key(order_id, last_event_id):
+    return f'order-tracking:{order_id}:{last_event_id}'
+
+
+def record(order):
+    """Write the order's current statuses to its timeline."""
+    OrderEvent.objects.create(order=order, status=order.status, delivery_status=order.delivery_status)
+
+
+def log(transitions, now=None):
+    """Bulk ``record`` for ``(order_id, order_number, status, delivery_status)`` tuples."""
+    extra = {'created_at': now} if now else {}
+    OrderEvent.objects.bulk_create([
+        OrderEvent(order_id=order_id, status=status, delivery_status=delivery_status, **extra)
+        for order_id, _, status, delivery_status in transitions
+    ])
+
+
+def lookup(order_number, user_id):
+    """The order numbered ``order_number``, with its ``timeline``, if it belongs to ``user_id``; else None."""
+    last_event = OrderEvent.objects.filter(order=OuterRef('pk')).order_by('-id').values('id')[:1]
+    # Only allow users to track their own orders
+    order = (
+        Order.objects.filter(order_number=order_number, user_id=user_id)
+        .annotate(last_event_id=Subquery(last_event)).first()
+    )
+    if order is None:
+        return None
+    key = _cache_key(order.pk, order.last_event_id)
+    order.timeline = cache.get(key)
+    if order.timeline is None:
+        order.timeline = list(order.events.all())
+        cache.set(key, order.timeline, CACHE_TIMEOUT)
+    return order
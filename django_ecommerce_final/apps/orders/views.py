@@ -2,18 +2,18 @@
 import requests
 import json
 import hashlib
-from django.conf import settings
 from django.shortcuts import redirect, render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
+from django.utils.translation import gettext as _
 from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.template.loader import get_template
-from xhtml2pdf import pisa
-import io
-from .models import Order, OrderItem
-from apps.store.models import Product
+from .models import Order
+from . import gateway, history, invoices, payments, tracking
+from .placement import place_order
+from .reservations import InsufficientStock
 from apps.store.cart import Cart
 
 def calculate_shipping_charge(division, district):
@@ -36,20 +36,12 @@ def calculate_shipping_charge(division, district):
 @login_required
 def checkout(request):
     cart_obj = Cart(request)
-    cart = cart_obj.cart
-    if not cart:
+    if not cart_obj.cart:
         return redirect('cart')
     
-    # Refresh prices one last time before calculating subtotal/total
-    for id, item in cart.items():
-        try:
-            product = Product.objects.get(id=id)
-            item['price'] = str(product.get_display_price())
-        except Product.DoesNotExist:
-            pass
-    cart_obj.save()
-    
-    subtotal = sum(float(i['price']) * i['qty'] for i in cart.values())
+    # Load and price every line once; reused for validation and the order items
+    lines, removed = cart_obj.hydrate()
+    subtotal = cart_obj.total()
     total = subtotal
     
     if request.method == 'POST':
@@ -58,7 +50,7 @@ def checkout(request):
         district = request.POST.get('city')
         
         shipping_charge = calculate_shipping_charge(division, district)
-        total = float(subtotal) + shipping_charge
+        total = subtotal + shipping_charge
         
         phone = request.POST.get('phone')
         if not phone:
@@ -66,49 +58,42 @@ def checkout(request):
             return redirect('checkout')
 
         # Validate stock availability before creating order
-        for id, item in cart.items():
-            try:
-                product = Product.objects.get(id=id)
-                if not product.is_in_stock:
-                    messages.error(request, f"{product.name} is out of stock. Please remove it from cart.")
-                    return redirect('cart')
-                if item['qty'] > product.stock:
-                    messages.error(request, f"Only {product.stock} units of {product.name} available. Please update your cart.")
-                    return redirect('cart')
-            except Product.DoesNotExist:
-                messages.error(request, "Some products in your cart are no longer available.")
+        if removed or not lines:
+            messages.error(request, "Some products in your cart are no longer available.")
+            return redirect('cart')
+        for line in lines:
+            product = line.product
+            if not product.is_in_stock:
+                messages.error(request, f"{product.name} is out of stock. Please remove it from cart.")
+                return redirect('cart')
+            if line.qty > product.available_stock:
+                messages.error(request, f"Only {product.available_stock} units of {product.name} available. Please update your cart.")
                 return redirect('cart')
 
-        # Create order with address information
-        order = Order.objects.create(
-            user=request.user, 
-            total=total,
-            shipping_charge=shipping_charge,
-            payment_method=payment_method,
-            full_name=request.POST.get('full_name'),
-            phone=request.POST.get('phone'),
-            email=request.POST.get('email'),
-            address_line_1=request.POST.get('address_line_1'),
-            address_line_2=request.POST.get('address_line_2'),
-            city=district,
-            state=division,
-            postal_code=request.POST.get('postal_code'),
-            country=request.POST.get('country', 'Bangladesh')
-        )
-        
-        for id, item in cart.items():
-            product = Product.objects.get(id=id)
-            OrderItem.objects.create(
-                order=order, 
-                product=product, 
-                quantity=item['qty'], 
-                price=item['price']
+        try:
+            # Order, items and stock holds are written together or not at all
+            order = place_order(
+                request.user,
+                lines,
+                total=total,
+                shipping_charge=shipping_charge,
+                payment_method=payment_method,
+                full_name=request.POST.get('full_name'),
+                phone=request.POST.get('phone'),
+                email=request.POST.get('email'),
+                address_line_1=request.POST.get('address_line_1'),
+                address_line_2=request.POST.get('address_line_2'),
+                city=district,
+                state=division,
+                postal_code=request.POST.get('postal_code'),
+                country=request.POST.get('country', 'Bangladesh')
             )
+        except InsufficientStock as e:
+            messages.error(request, f"{e}. Please update your cart.")
+            return redirect('cart')
             
         # Clear cart immediately after order is placed
-        if 'cart' in request.session:
-            del request.session['cart']
-            request.session.modified = True
+        cart_obj.clear()
         
         # Handle different payment methods
         if payment_method == 'cod':
@@ -135,7 +120,7 @@ def checkout(request):
         default_address = None
     
     context = {
-        'cart_items': cart,
+        'cart_items': lines,
         'subtotal': subtotal,
         'default_address': default_address
     }
@@ -146,26 +131,15 @@ def ssl_commerce_payment(request, order_id):
     """Initialize SSL Commerce payment"""
     order = get_object_or_404(Order, id=order_id, user=request.user)
     
-    # Block payment if order is cancelled or expired
-    order.check_and_cancel_if_expired()
-    if order.status == 'cancelled':
+    # Block payment if order is cancelled or expired; the sweeper cancels expired ones
+    if order.status == 'cancelled' or order.is_payment_expired:
         from django.contrib import messages
-        from django.utils.translation import gettext as _
         messages.error(request, _("This order has been cancelled and can no longer be paid for. Please place a new order."))
         return redirect('orders')
 
     if order.status == 'completed':
         return redirect('orders')
     
-    settings_dict = {
-        'store_id': settings.SSLCOMMERZ_STORE_ID,
-        'store_pass': settings.SSLCOMMERZ_STORE_PASS,
-        'issandbox': True  # Assuming sandbox based on settings
-    }
-    
-    from sslcommerz_lib.sslcommerz import SSLCOMMERZ
-    sslcz = SSLCOMMERZ(settings_dict)
-    
     post_body = {
         'total_amount': order.total,
         'currency': "BDT",
@@ -189,7 +163,7 @@ def ssl_commerce_payment(request, order_id):
     }
 
     try:
-        response = sslcz.createSession(post_body)
+        response = gateway.get_client().create_session(post_body)
         
         if response.get('status') == 'SUCCESS':
             order.transaction_id = response.get('sessionkey')
@@ -199,7 +173,7 @@ def ssl_commerce_payment(request, order_id):
             messages.error(request, f'Payment gateway error: {response.get("failedreason", "Unknown error")}')
             return redirect('checkout')
             
-    except Exception as e:
+    except gateway.GatewayError as e:
         print("SSLCommerz General Error:", str(e))
         messages.error(request, f'Payment processing error: {str(e)}')
         return redirect('checkout')
@@ -215,56 +189,23 @@ def payment_success(request):
             return redirect(f"{request.path}?val_id={val_id}")
     
     val_id = request.GET.get('val_id')
-    # Some gateways return as POST, some GET. Ensure we check both or adapt.
-    # The library might expect just val_id.
     
     if val_id:
-        try:
-            settings_dict = {
-                'store_id': settings.SSLCOMMERZ_STORE_ID,
-                'store_pass': settings.SSLCOMMERZ_STORE_PASS,
-                'issandbox': True
-            }
-            from sslcommerz_lib.sslcommerz import SSLCOMMERZ
-            sslcz = SSLCOMMERZ(settings_dict)
-            
-            # Identify which order this validation is for?
-            # Usually we need to look up the transaction/order first so we can update it.
-            # But validateTransactionOrder output usually contains tran_id.
-            
-            # The manual implementation relied on tran_id parameter.
-            # Let's rely on validation result.
-            
-            validation_result = sslcz.validationTransactionOrder(val_id)
-            
-            if validation_result.get('status') == 'VALID' or validation_result.get('status') == 'VALIDATED':
-                tran_id = validation_result.get('tran_id')
-                if tran_id:
-                     order_id = tran_id.split('_')[1]
-                     try:
-                        order = Order.objects.get(id=order_id)
-                        order.status = 'completed'
-                        order.transaction_id = tran_id
-                        order.save()
-                        
-                        # Deduct stock for each item in the order
-                        for item in order.orderitem_set.all():
-                            product = item.product
-                            product.stock -= item.quantity
-                            product.save()
-                            
-                        messages.success(request, 'Payment successful! Your order has been confirmed.')
-                        return render(request, 'orders/success.html', {'order': order})
-                     except Order.DoesNotExist:
-                        pass
-            
-            messages.error(request, 'Payment validation failed.')
-            return render(request, 'orders/fail.html')
-            
-        except Exception as e:
-            print(f"Validation Error: {e}")
+        # Recorded once per val_id, so a reloaded page does not apply it again
+        event = payments.record('success', {'val_id': val_id})
+        payments.process([event])
+        event.refresh_from_db()
+        
+        if event.order and event.order.status == 'completed':
+            messages.success(request, 'Payment successful! Your order has been confirmed.')
+            return render(request, 'orders/success.html', {'order': event.order})
+        
+        if event.processed_at is None:
+            # The gateway could not be reached; the payment worker retries
             messages.error(request, 'Payment validation error.')
-            return render(request, 'orders/fail.html')
+        else:
+            messages.error(request, 'Payment validation failed.')
+        return render(request, 'orders/fail.html')
     
     messages.error(request, 'Invalid payment response.')
     return render(request, 'orders/fail.html')
@@ -278,23 +219,22 @@ def payment_fail(request):
             return redirect(f"{request.path}?tran_id={transaction_id}")
 
     transaction_id = request.GET.get('tran_id')
-    order_id = transaction_id.split('_')[1] if transaction_id else None
     
-    if order_id:
-        try:
-            order = Order.objects.get(id=order_id)
-            # Check for expiration if payment failed
-            order.check_and_cancel_if_expired()
+    if transaction_id:
+        event = payments.record('fail', {'tran_id': transaction_id})
+        payments.process([event])
+        event.refresh_from_db()
+        order = event.order
+        if order:
+            if order.status == 'completed':
+                messages.success(request, 'This order has already been paid.')
+                return render(request, 'orders/success.html', {'order': order})
             if order.status != 'cancelled':
-                order.status = 'failed'
-                order.save()
                 messages.error(request, 'Payment failed. Please try again.')
             else:
                 messages.error(request, 'Payment failed and the 10-minute window has expired.')
             
             return render(request, 'orders/fail.html', {'order': order})
-        except Order.DoesNotExist:
-            pass
     
     messages.error(request, 'Payment failed.')
     return render(request, 'orders/fail.html')
@@ -308,22 +248,22 @@ def payment_cancel(request):
             return redirect(f"{request.path}?tran_id={transaction_id}")
 
     transaction_id = request.GET.get('tran_id')
-    order_id = transaction_id.split('_')[1] if transaction_id else None
     
-    if order_id:
-        try:
-            order = Order.objects.get(id=order_id)
-            # Treat cancellation as a failed payment to allow retry within timeout
-            order.check_and_cancel_if_expired()
+    if transaction_id:
+        # Treated as a failed payment to allow retry within timeout
+        event = payments.record('cancel', {'tran_id': transaction_id})
+        payments.process([event])
+        event.refresh_from_db()
+        order = event.order
+        if order:
+            if order.status == 'completed':
+                messages.success(request, 'This order has already been paid.')
+                return render(request, 'orders/success.html', {'order': order})
             if order.status != 'cancelled':
-                order.status = 'failed'
-                order.save()
                 messages.warning(request, 'Payment cancelled. You can try again.')
                 return render(request, 'orders/fail.html', {'order': order})
             
             return render(request, 'orders/cancel.html', {'order': order})
-        except Order.DoesNotExist:
-            pass
     
     messages.warning(request, 'Payment cancelled.')
     return render(request, 'orders/cancel.html')
@@ -332,73 +272,43 @@ def payment_cancel(request):
 def payment_ipn(request):
     """Handle IPN (Instant Payment Notification) from SSL Commerce"""
     if request.method == 'POST':
-        transaction_id = request.POST.get('tran_id')
-        order_id = transaction_id.split('_')[1] if transaction_id else None
-        status = request.POST.get('status')
-        
-        if order_id and status == 'VALID':
-            try:
-                order = Order.objects.get(id=order_id)
-                order.status = 'completed'
-                order.transaction_id = transaction_id
-                order.save()
-            except Order.DoesNotExist:
-                pass
+        # Acknowledged once stored; process_payment_events applies it
+        payments.record('ipn', request.POST.dict())
     
     return JsonResponse({'status': 'ok'})
 
 @login_required
 def orders(request):
-    """Display user's order history"""
-    orders = Order.objects.filter(user=request.user).prefetch_related('orderitem_set__product').order_by('-created_at')
-    now = timezone.now()
+    """Display user's order history, newest first, a page at a time"""
+    orders, next_cursor = history.page(
+        Order.objects.filter(user=request.user), request.GET.get('cursor'),
+    )
     
-    # Add payment warning info to each order
-    for order in orders:
-        # Check for expiration before processing
-        order.check_and_cancel_if_expired()
-        
-        if ((order.status == 'pending' or order.status == 'failed') and 
-            order.payment_method == 'sslcommerz' and 
-            order.payment_timeout and 
-            order.payment_timeout > now):
-            
-            time_diff = order.payment_timeout - now
-            minutes_remaining = int(time_diff.total_seconds() / 60)
-            order.show_pay_now = True
-            order.minutes_remaining = minutes_remaining
-        else:
-            order.show_pay_now = False
-            order.minutes_remaining = 0
-    
-    return render(request, 'orders/orders.html', {'orders': orders, 'now': now})
+    return render(request, 'orders/orders.html', {
+        'orders': orders,
+        'now': timezone.now(),
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+    })
 
 @login_required
 def paymentable_orders(request):
     """Display orders pending payment"""
-    from django.utils import timezone
     now = timezone.now()
-    
-    from django.db.models import Q
-    orders = Order.objects.filter(
-        user=request.user,
-        payment_method='sslcommerz',
-        payment_timeout__gt=now
-    ).filter(
-        Q(status='pending') | Q(status='failed')
-    ).prefetch_related('orderitem_set__product').order_by('payment_timeout')
-    
-    # Add payment warning info
-    for order in orders:
-        time_diff = order.payment_timeout - now
-        minutes_remaining = time_diff.total_seconds() / 60
-        order.show_pay_now = True
-        order.minutes_remaining = int(minutes_remaining)
+    orders, next_cursor = history.page(
+        Order.objects.filter(history.payable_filter(now), user=request.user),
+        request.GET.get('cursor'), field='payment_timeout', descending=False,
+    )
     
     return render(request, 'orders/orders.html', {
         'orders': orders, 
         'now': now,
-        'page_title': 'Pending Payments'
+        'page_title': 'Pending Payments',
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        # Sorted by payment deadline, not by age
+        'first_page_label': _('Expiring soonest'),
+        'next_page_label': _('Expiring later'),
     })
 
 @login_required
@@ -410,12 +320,6 @@ def cod_success(request, order_id):
     order.status = 'completed'
     order.save()
     
-    # Deduct stock for each item in the order
-    for item in order.orderitem_set.all():
-        product = item.product
-        product.stock -= item.quantity
-        product.save()
-    
     return render(request, 'orders/cod_success.html', {'order': order})
 
 @login_required
@@ -425,12 +329,9 @@ def order_tracking(request):
     order = None
     
     if order_number:
-        try:
-            # Only allow users to track their own orders
-            order = Order.objects.get(order_number=order_number, user=request.user)
-            # Check for expiration
-            order.check_and_cancel_if_expired()
-            
+        # Only the user's own orders; the timeline is served from the cache
+        order = tracking.lookup(order_number, request.user.pk)
+        if order:
             # Calculate payment info for tracking page
             now = timezone.now()
             
@@ -439,14 +340,9 @@ def order_tracking(request):
                 order.payment_timeout and 
                 order.payment_timeout > now):
                 
-                time_diff = order.payment_timeout - now
-                order.minutes_remaining = int(time_diff.total_seconds() / 60)
                 order.show_pay_now = True
             else:
                 order.show_pay_now = False
-                
-        except Order.DoesNotExist:
-            pass
     
     return render(request, 'orders/tracking.html', {
         'order': order,
@@ -464,12 +360,6 @@ def cancel_order(request, order_id):
         order.delivery_status = 'cancelled'
         order.save()
         
-        # Restore stock for cancelled orders
-        for item in order.orderitem_set.all():
-            product = item.product
-            product.stock += item.quantity
-            product.save()
-        
         messages.success(request, f'Order #{order.order_number} has been cancelled.')
     else:
         messages.error(request, 'This order cannot be cancelled.')
@@ -487,47 +377,27 @@ def generate_invoice_pdf(request, order_id):
         messages.warning(request, "Invoice is available after successful payment.")
         return redirect('orders')
 
-    template_path = 'orders/invoice_pdf.html'
-    
-    # Pre-format numeric values to strings to avoid template rendering issues in PDF engine
-    from django.contrib.humanize.templatetags.humanize import intcomma
-    
-    formatted_subtotal = intcomma(order.get_subtotal())
-    formatted_shipping = intcomma(order.shipping_charge)
-    formatted_total = intcomma(order.total)
-    
-    # Also format item prices - Convert to list to ensure attributes stick
-    items = list(order.orderitem_set.all())
-    for item in items:
-        item.formatted_price = intcomma(item.price)
-        item.formatted_total = intcomma(item.get_total_price())
-
-    import os
-    from django.conf import settings
-    logo_path = os.path.join(settings.BASE_DIR, 'static', 'images', 'icon.gif')
+    filename = f"Invoice_{order.order_number}.pdf"
+    try:
+        if order.status == 'completed':
+            # The PDF was rendered in the background when the order completed
+            invoice = invoices.stored(order)
+            if invoice is None and not invoices.render_failed(order):
+                invoices.schedule(order)
+                response = HttpResponse("Your invoice is being prepared. Please try again in a few seconds.", status=503)
+                response['Retry-After'] = '5'
+                return response
+            if invoice is None:
+                # Render here so the error is shown
+                invoice = invoices.build(order)
+            name, tag = invoice
+            return invoices.serve(request, name, filename, tag)
 
-    context = {
-        'order': order,
-        'items': items,
-        'subtotal': formatted_subtotal,
-        'shipping': formatted_shipping,
-        'total': formatted_total,
-        'logo_path': logo_path,
-    }
-    
-    # Create a Django response object, and specify content_type as pdf
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="Invoice_{order.order_number}.pdf"'
-    
-    from django.template.loader import render_to_string
-    html = render_to_string(template_path, context)
+        # Staff preview of an unpaid order; not worth storing
+        pdf = invoices.render_pdf(invoices.render_html(order))
+    except invoices.InvoiceError as e:
+        return HttpResponse(f'{e}<br><pre>{e.html}</pre>')
 
-    # create a pdf
-    pisa_status = pisa.CreatePDF(
-       html, dest=response, encoding='utf-8')
-    
-    # if error then return error response
-    if pisa_status.err:
-       return HttpResponse(f'Error generating PDF: {pisa_status.err}<br><pre>{html}</pre>')
-    
+    response = HttpResponse(pdf, content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
     return response
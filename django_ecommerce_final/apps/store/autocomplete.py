@@ -0,0 +1,198 @@
+"""
+In-process prefix index for search box suggestions.
+
+Every product and category name is stored as a set of keys in one sorted
+list: the full name plus each word-suffix ("macbook pro m2", "pro m2", "m2"),
+so typing any word of a name finds it. Lookups are a ``bisect`` plus a short
+forward scan and never touch the database.
+
+The Product/Category save and delete signals queue their changes once the
+transaction commits, and the next lookup applies the whole queue at once by
+building new lists and swapping them in, so lookups never see one half-done
+and a bulk import costs one rebuild rather than one copy per row. Only adds,
+deletes and changed names or slugs count: other saves (stock, prices) leave
+the index alone.
+
+Such a change also replaces a marker in the shared cache. Every lookup
+compares it with the marker the index was loaded under (one cache get); when
+another process moved it, the index is reloaded in a background thread while
+lookups keep being answered from the current lists.
+"""
+import threading
+import uuid
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.urls import reverse
+from .search import tokenize
+
+PRODUCT = 'product'
+CATEGORY = 'category'
+
+# Stop scanning after this many matching keys; plenty to fill a dropdown
+MAX_SCAN = 200
+
+MARKER_KEY = 'prefix-index-marker'
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='autocomplete')
+
+
+def normalize(text):
+    return ' '.join(tokenize((text or '').casefold()))
+
+
+class PrefixIndex:
+    def __init__(self):
+        # Sorted (key, word_position, kind, pk) tuples
+        self._keys = []
+        # (kind, pk) -> (label, slug)
+        self._entries = {}
+        # (kind, pk) -> (label, slug), or None for a removal; applied on lookup
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._marker = None
+        self._reloading = False
+
+    def _keys_for(self, kind, pk, label):
+        words = normalize(label).split(' ')
+        return [(' '.join(words[i:]), i, kind, pk) for i in range(len(words)) if words[i]]
+
+    def _apply_pending(self):
+        # Copy-on-write: readers keep scanning the lists they already hold,
+        # the queued changes land in new ones, so lookups need no lock
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            keys = [key for key in self._keys if (key[2], key[3]) not in pending]
+            entries = dict(self._entries)
+            for (kind, pk), entry in pending.items():
+                if entry is None:
+                    entries.pop((kind, pk), None)
+                else:
+                    entries[(kind, pk)] = entry
+                    keys.extend(self._keys_for(kind, pk, entry[0]))
+            keys.sort()
+            self._keys, self._entries = keys, entries
+
+    def load(self, marker=None):
+        """(Re)build the whole index from the database."""
+        from .models import Product, Category
+
+        # Changes queued before this point are in what is read below; later
+        # ones stay queued and are applied on top.
+        with self._lock:
+            self._pending = {}
+        # Read the marker first so a change racing with the load triggers another
+        marker = marker or cache.get(MARKER_KEY)
+        keys, entries = [], {}
+        sources = (
+            (PRODUCT, Product.objects.values_list('id', 'name', 'slug')),
+            (CATEGORY, Category.objects.values_list('id', 'name', 'slug')),
+        )
+        for kind, rows in sources:
+            for pk, label, slug in rows:
+                entries[(kind, pk)] = (label, slug)
+                keys.extend(self._keys_for(kind, pk, label))
+        keys.sort()
+
+        with self._lock:
+            self._keys, self._entries = keys, entries
+            self._loaded = True
+            self._marker = marker
+
+    def _reload(self, marker):
+        try:
+            self.load(marker)
+        finally:
+            self._reloading = False
+            connection.close()
+
+    def ensure_loaded(self):
+        marker = cache.get(MARKER_KEY)
+        if not self._loaded:
+            self.load(marker)
+        elif marker != self._marker and not self._reloading:
+            # Another process changed the catalog; keep answering meanwhile
+            self._reloading = True
+            _executor.submit(self._reload, marker)
+        if self._pending:
+            self._apply_pending()
+
+    def _publish(self):
+        # A marker this process already holds moves along with it: its own
+        # change is queued and needs no reload
+        with self._lock:
+            current = cache.get(MARKER_KEY)
+            marker = uuid.uuid4().hex
+            cache.set(MARKER_KEY, marker, None)
+            if current == self._marker:
+                self._marker = marker
+
+    def _queue(self, kind, pk, entry):
+        def changed():
+            if self._loaded:
+                with self._lock:
+                    self._pending[(kind, pk)] = entry
+            self._publish()
+        transaction.on_commit(changed)
+
+    def update(self, kind, pk, label, slug):
+        """Queue an insert or replace of one entry, unless its name and slug are unchanged."""
+        entry = (label, slug)
+        if self._loaded and (kind, pk) not in self._pending and self._entries.get((kind, pk)) == entry:
+            return
+        self._queue(kind, pk, entry)
+
+    def remove(self, kind, pk):
+        self._queue(kind, pk, None)
+
+    def lookup(self, text, limit=8):
+        """
+        Return ``(kind, pk, label, slug)`` suggestions whose name has a word
+        starting with ``text``. Names that start with the text rank first,
+        then shorter names.
+        """
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        self.ensure_loaded()
+
+        keys, entries = self._keys, self._entries
+        matches = {}
+        index = bisect_left(keys, (prefix,))
+        end = min(len(keys), index + MAX_SCAN)
+        while index < end:
+            key, position, kind, pk = keys[index]
+            if not key.startswith(prefix):
+                break
+            if (kind, pk) not in matches or position < matches[(kind, pk)]:
+                matches[(kind, pk)] = position
+            index += 1
+
+        results = []
+        for (kind, pk), position in matches.items():
+            entry = entries.get((kind, pk))
+            if entry:
+                results.append((position, len(entry[0]), kind, pk, entry[0], entry[1]))
+        results.sort()
+        return [(kind, pk, label, slug) for _, _, kind, pk, label, slug in results[:limit]]
+
+
+index = PrefixIndex()
+
+
+def suggest(text, limit=8):
+    """Return JSON-ready suggestions for the search box."""
+    suggestions = []
+    for kind, pk, label, slug in index.lookup(text, limit=limit):
+        if kind == CATEGORY:
+            url = f"{reverse('home')}?category={slug}"
+        elif slug:
+            url = reverse('product_detail', args=[slug])
+        else:
+            url = reverse('product_detail_id', args=[pk])
+        suggestions.append({'type': kind, 'id': pk, 'label': label, 'url': url})
+    return suggestions
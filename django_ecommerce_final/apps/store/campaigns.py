@@ -0,0 +1,184 @@
+"""
+In-process campaign timeline.
+
+Campaigns are few and change rarely, but the storefront asks "what is running
+now?" on every hit. The timeline loads all campaigns once, cuts time into
+segments at every start/end boundary and precomputes what is running (and
+which campaign the home page features) in each segment. A lookup is a
+``bisect`` over the boundaries, and the current segment is remembered until
+its end passes, so the storefront resolves campaigns without a query.
+
+The product ids of every active campaign are loaded too, so ``campaign_for``
+prices a product live: listings, product pages and the cart all resolve
+discounts here, and agree at the moment a campaign starts or ends.
+
+Campaign saves, deletes and product set changes invalidate the timeline
+through their signals: the process making the change reloads on its next
+lookup, and once the change commits a marker in the shared cache is
+replaced. Every lookup compares that marker with the one it loaded under
+(one cache get), so other processes reload on their next lookup too.
+Changes the signals do not see, or a cache that is not shared, are caught
+by the campaign table's own version (row count, highest id and latest
+``updated_at``, which product set changes bump too), re-read at most every
+``CHECK_INTERVAL`` seconds.
+
+The materialized ``effective_price`` column only backs price sorting and is
+not touched here when a campaign starts or ends:
+``manage.py refresh_campaign_prices`` brings it forward.
+"""
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from collections import namedtuple
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+CHECK_INTERVAL = 30.0
+MARKER_KEY = 'campaign-timeline-marker'
+
+# running: campaigns discounting products, lowest id first (as in pricing)
+# featured: the campaign the home page shows, running or upcoming
+Segment = namedtuple('Segment', 'valid_from valid_until running featured')
+
+
+def _segment_state(campaigns, t):
+    """Running and featured campaigns at ``t`` (None meaning before any boundary)."""
+    running, featured = [], None
+    for campaign in campaigns:
+        start, end = campaign.start_time, campaign.end_time
+        if not end or (t is not None and end <= t):
+            continue
+        if featured is None:
+            featured = campaign
+        if start and t is not None and start <= t:
+            running.append(campaign)
+    return tuple(running), featured
+
+
+class CampaignTimeline:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._marker = None
+        self._checked_at = 0.0
+        self._campaigns = {}
+        # campaign id -> ids of its products, for active campaigns
+        self._members = {}
+        self._boundaries = []
+        self._segments = []
+        self._current = None
+
+    @staticmethod
+    def _db_version():
+        from .models import Campaign
+
+        state = Campaign.objects.aggregate(count=Count('id'), last=Max('id'), updated=Max('updated_at'))
+        return (state['count'], state['last'], state['updated'])
+
+    @property
+    def version(self):
+        """The campaign table version (count, highest id, latest ``updated_at``) loaded."""
+        self._ensure_loaded()
+        return self._version
+
+    def load(self, version=None, marker=None):
+        """(Re)build the timeline from the database."""
+        from .models import Campaign
+
+        # Read the versions first so a change racing with the load triggers another
+        marker = marker or cache.get(MARKER_KEY)
+        version = version or self._db_version()
+        campaigns = {campaign.pk: campaign for campaign in Campaign.objects.order_by('id')}
+        active = [campaign for campaign in campaigns.values() if campaign.is_active]
+        members = {campaign.pk: set() for campaign in active}
+        links = Campaign.products.through.objects.filter(campaign_id__in=members)
+        for campaign_id, product_id in links.values_list('campaign_id', 'product_id').iterator():
+            members[campaign_id].add(product_id)
+        boundaries = sorted({
+            boundary for campaign in active
+            for boundary in (campaign.start_time, campaign.end_time) if boundary
+        })
+        segments = [_segment_state(active, None)]
+        segments += [_segment_state(active, boundary) for boundary in boundaries]
+
+        with self._lock:
+            self._version = version
+            self._marker = marker
+            self._checked_at = time.monotonic()
+            self._campaigns = campaigns
+            self._members = members
+            self._boundaries = boundaries
+            self._segments = segments
+            self._current = None
+
+    def invalidate(self):
+        """Reload on the next lookup here, and in every process once the change commits."""
+        self._version = None
+
+        def publish():
+            cache.set(MARKER_KEY, uuid.uuid4().hex, None)
+            self._version = None
+        transaction.on_commit(publish)
+
+    def _ensure_loaded(self):
+        marker = cache.get(MARKER_KEY)
+        if self._version is not None and marker == self._marker \
+                and time.monotonic() - self._checked_at < CHECK_INTERVAL:
+            return
+        version = self._db_version()
+        if version != self._version or marker != self._marker:
+            self.load(version, marker)
+        else:
+            self._checked_at = time.monotonic()
+
+    def segment(self, now=None):
+        """The ``Segment`` containing ``now``: O(1) until its end passes, else O(log n)."""
+        self._ensure_loaded()
+        now = now or timezone.now()
+        current = self._current
+        if current and (current.valid_from is None or current.valid_from <= now) \
+                and (current.valid_until is None or now < current.valid_until):
+            return current
+
+        boundaries = self._boundaries
+        index = bisect_right(boundaries, now)
+        running, featured = self._segments[index]
+        segment = Segment(
+            boundaries[index - 1] if index else None,
+            boundaries[index] if index < len(boundaries) else None,
+            running, featured,
+        )
+        self._current = segment
+        return segment
+
+    def running(self, now=None):
+        return self.segment(now).running
+
+    def featured(self, now=None):
+        return self.segment(now).featured
+
+    def campaign_for(self, product_id, now=None):
+        """
+        The running campaign discounting a product, or None.
+
+        As in ``pricing.get_active_campaigns``, the lowest campaign id wins
+        when a product belongs to several.
+        """
+        # running() may (re)load the timeline, so read the members after it
+        running = self.running(now)
+        members = self._members
+        for campaign in running:
+            if product_id in members.get(campaign.pk, ()):
+                return campaign
+        return None
+
+    def get(self, pk):
+        """A campaign by id, or None."""
+        self._ensure_loaded()
+        return self._campaigns.get(pk)
+
+
+timeline = CampaignTimeline()
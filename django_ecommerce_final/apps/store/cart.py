@@ -1,21 +1,241 @@
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+CART_CACHE_TIMEOUT = 60 * 60 * 24
+
+def summarize(cart):
+ """Build a cart summary from scratch; Cart keeps it current incrementally afterwards"""
+ return {
+  'count':sum(item['qty'] for item in cart.values()),
+  'lines':len(cart),
+  'subtotal':str(sum((Decimal(item['price'])*item['qty'] for item in cart.values()),Decimal('0'))),
+  'version':0,
+ }
+
+class SessionCartStore:
+ """Cart kept in the session (the default)"""
+ def __init__(self,session):
+  self.session=session
+ def load(self):
+  return self.session.get('cart',{})
+ def load_summary(self):
+  return self.session.get('cart_summary')
+ def save_summary(self,summary):
+  self.session['cart_summary']=summary
+ def write(self,cart,ids,summary):
+  self.session['cart']=cart
+  self.session['cart_summary']=summary
+  self.session.modified=True
+ def clear(self):
+  for key in ('cart','cart_summary'):
+   if key in self.session: del self.session[key]
+
+class DatabaseCartStore:
+ """
+ Cart kept in SavedCart rows, cached under the row's version.
+
+ Every write bumps ``SavedCart.version``, and cache entries are keyed by it,
+ so a change made on another worker or device is seen on the next request
+ even though the cache itself is per process.
+ """
+ def __init__(self,user):
+  self.user=user
+  self._version=None
+ def _key(self,name):
+  return f'{name}:{self.user.pk}:{self.version}'
+ @property
+ def version(self):
+  # Read once per request
+  if self._version is None:
+   from .models import SavedCart
+   self._version=SavedCart.objects.filter(user=self.user).values_list('version',flat=True).first() or 0
+  return self._version
+ def load(self):
+  key=self._key('cart')
+  cart=cache.get(key)
+  if cart is None:
+   from .models import SavedCartItem
+   # Read after the version, so the lines are at least that new
+   rows=SavedCartItem.objects.filter(cart__user=self.user).values_list('product_id','quantity','price')
+   cart={str(product_id):{'qty':qty,'price':str(price)} for product_id,qty,price in rows}
+   cache.set(key,cart,CART_CACHE_TIMEOUT)
+  return cart
+ def load_summary(self):
+  return cache.get(self._key('cart-summary'))
+ def save_summary(self,summary):
+  summary['version']=self.version
+  cache.set(self._key('cart-summary'),summary,CART_CACHE_TIMEOUT)
+ def write(self,cart,ids,summary):
+  """Write only the lines in ``ids`` and bump the version"""
+  from .models import SavedCart, SavedCartItem
+  if not ids: return
+  loaded=self.version
+  with transaction.atomic():
+   saved,_=SavedCart.objects.get_or_create(user=self.user)
+   # Bumped first: the row stays locked until commit, so a concurrent
+   # writer waits and then finds the version moved on
+   current=SavedCart.objects.filter(pk=saved.pk,version=loaded).update(version=F('version')+1)
+   if not current:
+    SavedCart.objects.filter(pk=saved.pk).update(version=F('version')+1)
+   for id in ids:
+    item=cart.get(id)
+    if item is None:
+     SavedCartItem.objects.filter(cart=saved,product_id=id).delete()
+    else:
+     SavedCartItem.objects.update_or_create(cart=saved,product_id=id,defaults={'quantity':item['qty'],'price':item['price']})
+   self._version=SavedCart.objects.filter(pk=saved.pk).values_list('version',flat=True).get()
+  if current:
+   # Nothing else changed the cart since it was loaded, so this is its state
+   summary['version']=self._version
+   cache.set_many({self._key('cart'):cart,self._key('cart-summary'):summary},CART_CACHE_TIMEOUT)
+ def clear(self):
+  from .models import SavedCart, SavedCartItem
+  with transaction.atomic():
+   SavedCartItem.objects.filter(cart__user=self.user).delete()
+   SavedCart.objects.filter(user=self.user).update(version=F('version')+1)
+  self._version=None
+
+def get_store(request):
+ if settings.PERSISTENT_CART and request.user.is_authenticated:
+  # Shared by every Cart of the request, so the version is read once
+  if not hasattr(request,'_cart_store'):
+   request._cart_store=DatabaseCartStore(request.user)
+  return request._cart_store
+ return SessionCartStore(request.session)
+
+def merge_session_cart(request,user):
+ """Fold the cart built before logging in into the user's saved cart"""
+ session_cart=request.session.get('cart')
+ if not settings.PERSISTENT_CART or not session_cart: return
+ store=DatabaseCartStore(user)
+ cart=store.load()
+ for id,item in session_cart.items():
+  line=cart.setdefault(id,{'qty':0,'price':item['price']})
+  line['qty']+=item['qty']
+  line['price']=item['price']
+ summary=summarize(cart)
+ summary['version']=(store.load_summary() or {}).get('version',0)+1
+ store.write(cart,list(session_cart),summary)
+ SessionCartStore(request.session).clear()
+
+class CartLine:
+ """A cart entry with its product loaded and priced"""
+ def __init__(self,product,qty,price):
+  self.product=product
+  self.qty=qty
+  self.price=price
+ @property
+ def total(self):
+  return self.price*self.qty
 
 class Cart:
  def __init__(self,request):
+  self.request=request
   self.session=request.session
-  self.cart=self.session.get('cart',{})
+  self.store=get_store(request)
+  self._cart=None
+  self._summary=None
+ @property
+ def cart(self):
+  # Loaded on first use so summary reads never touch the lines
+  if self._cart is None: self._cart=self.store.load()
+  return self._cart
+ @property
+ def summary(self):
+  """``{'count', 'lines', 'subtotal', 'version'}`` without reading the lines"""
+  if self._summary is None:
+   self._summary=self.store.load_summary()
+   if self._summary is None:
+    # Cart stored before summaries were kept; an empty one is not worth storing
+    self._summary=summarize(self.cart)
+    if self.cart: self.store.save_summary(self._summary)
+  return self._summary
  def add(self,id,price):
   id=str(id)
-  self.cart.setdefault(id,{'qty':0,'price':str(price)})
-  self.cart[id]['qty']+=1
-  self.save()
+  self.summary # summarize before mutating a cart stored without one
+  is_new=id not in self.cart
+  item=self.cart.setdefault(id,{'qty':0,'price':str(price)})
+  item['qty']+=1
+  self._adjust(1,Decimal(item['price']),lines=int(is_new))
+  self._changed(id)
  def update(self,id,qty):
   id=str(id)
-  if id in self.cart: self.cart[id]['qty']=qty
-  self.save()
+  if id in self.cart and self.cart[id]['qty']!=qty:
+   self.summary
+   item=self.cart[id]
+   delta=qty-item['qty']
+   item['qty']=qty
+   self._adjust(delta,delta*Decimal(item['price']))
+   self._changed(id)
  def remove(self,id):
   id=str(id)
-  if id in self.cart: del self.cart[id]
-  self.save()
+  if id in self.cart:
+   self.summary
+   item=self.cart.pop(id)
+   self._adjust(-item['qty'],-item['qty']*Decimal(item['price']),lines=-1)
+   self._changed(id)
  def save(self):
-  self.session['cart']=self.cart
-  self.session.modified=True
+  version=self.summary['version']
+  self._summary=summarize(self.cart)
+  self._summary['version']=version+1
+  self._changed(*self.cart)
+ def clear(self):
+  self._cart={}
+  self._summary=None
+  self.store.clear()
+  self.request.__dict__.pop('_cart_lines',None)
+ def _adjust(self,qty,amount,lines=0):
+  summary=self.summary
+  summary['count']+=qty
+  summary['lines']+=lines
+  summary['subtotal']=str(Decimal(summary['subtotal'])+amount)
+  summary['version']+=1
+ def _changed(self,*ids):
+  # Only the touched lines are written
+  self.store.write(self.cart,ids,self.summary)
+  # Contents changed; hydrate again on next use
+  self.request.__dict__.pop('_cart_lines',None)
+ def hydrate(self):
+  """
+  Load every line's product with one query and price them live.
+
+  Returns ``(lines, removed_ids)``; products that no longer exist are dropped
+  from the cart. The stored prices are refreshed so started or ended
+  campaigns apply. The result is shared by every Cart of the request until
+  the cart changes.
+  """
+  cached=getattr(self.request,'_cart_lines',None)
+  if cached is not None: return cached
+  from .models import Product
+  from .pricing import attach_pricing
+  products=Product.objects.in_bulk([int(id) for id in self.cart])
+  attach_pricing(products.values())
+  self.summary
+  lines=[]
+  removed=[]
+  repriced=[]
+  for id,item in self.cart.items():
+   product=products.get(int(id))
+   if product is None:
+    removed.append(id)
+    continue
+   price=product.get_display_price()
+   if item['price']!=str(price):
+    self._adjust(0,(price-Decimal(item['price']))*item['qty'])
+    item['price']=str(price)
+    repriced.append(id)
+   lines.append(CartLine(product,item['qty'],price))
+  for id in removed:
+   item=self.cart.pop(id)
+   self._adjust(-item['qty'],-item['qty']*Decimal(item['price']),lines=-1)
+  if removed or repriced: self._changed(*removed,*repriced)
+  self.request._cart_lines=(lines,removed)
+  return self.request._cart_lines
+ @property
+ def lines(self):
+  return self.hydrate()[0]
+ def total(self):
+  return sum((line.total for line in self.lines),Decimal('0'))
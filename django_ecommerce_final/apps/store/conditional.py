@@ -0,0 +1,92 @@
+"""
+Conditional GET support for the catalog pages.
+
+The catalog state is summarized by a few aggregate queries (product and
+category update stamps, the latest recommendation run) plus the campaign
+table version and timeline segment at "now", which is far cheaper than
+rendering a listing. Together with the language and any user-specific bits
+it forms an ETag, so repeat visits are answered with a 304 Not Modified by
+Django's ``condition`` decorator.
+
+No Last-Modified is sent: deleting a product or category leaves every
+remaining ``updated_at`` as it was, so only the row counts in the ETag
+notice it and a date-only revalidation would serve the deleted row.
+"""
+import hashlib
+from functools import wraps
+from django.contrib import messages
+from django.db.models import Count, Max
+from django.utils import translation
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+
+def get_catalog_version(request):
+    """Return a version string for the catalog, memoized per request."""
+    if hasattr(request, '_catalog_version'):
+        return request._catalog_version
+
+    from .models import Product, Category, CoPurchaseRun
+    from .campaigns import timeline
+
+    products = Product.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    categories = Category.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    # Recommendations on product_detail change whenever the miner runs
+    recommendations = CoPurchaseRun.objects.aggregate(run=Max('id'))['run']
+
+    # The segment changes whenever a campaign starts or ends, so the version
+    # moves on at the boundary even though no row changed. The campaign
+    # table version also counts rows, so deleting any campaign moves it.
+    segment = timeline.segment()
+    request._catalog_version = '|'.join(str(part) for part in (
+        products['count'], products['updated'],
+        categories['count'], categories['updated'],
+        timeline.version, segment.valid_from, recommendations,
+    ))
+    return request._catalog_version
+
+
+def get_header_state(request):
+    """User-specific bits rendered by base.html on every page."""
+    # The badges are filled in by the header_state endpoint, so only the
+    # user's identity is part of the rendered page.
+    if not request.user.is_authenticated:
+        return 'anonymous'
+    return str(request.user.pk)
+
+
+def _has_pending_messages(request):
+    # len() loads the messages without marking them as used
+    return len(messages.get_messages(request)) > 0
+
+
+def catalog_condition(user_state=None):
+    """
+    Answer conditional GETs for a catalog view with 304 when nothing changed.
+
+    ``user_state`` may be a callable ``(request, *args, **kwargs)`` returning
+    extra per-user state the view renders (wishlist flags and the like).
+    Staff and requests with pending flash messages always get a full render.
+    """
+    def decorator(view_func):
+        def etag_func(request, *args, **kwargs):
+            version = get_catalog_version(request)
+            parts = [version, translation.get_language(), get_header_state(request)]
+            if user_state and request.user.is_authenticated:
+                parts.append(user_state(request, *args, **kwargs))
+            return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+        conditional_view = condition(etag_func=etag_func)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.user.is_staff or _has_pending_messages(request):
+                return view_func(request, *args, **kwargs)
+            response = conditional_view(request, *args, **kwargs)
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, no_cache=True)
+            else:
+                patch_cache_control(response, public=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,121 @@
+"""
+Counts shown in the storefront header, served as one JSON document.
+
+The database-backed counts (wishlist items, orders awaiting payment and
+unread notifications) are cached per user under a version read from the
+database in one query. The signals of those models drop both from the cache
+as soon as something changes; the version itself is cached for
+``VERSION_TIMEOUT`` seconds, so a change that bypasses the signals
+(a queryset update, a bulk insert) is picked up within that time while
+polling costs no query in between. The cart count is read from the cart
+summary; anonymous visitors without a session get zeros without one being
+created. The endpoint sends an ETag, so the header's polling is answered
+with an empty 304 until something changes.
+"""
+import hashlib
+import json
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery
+from django.utils import timezone
+
+CACHE_TIMEOUT = 60 * 60
+VERSION_TIMEOUT = 30
+
+
+def _cache_key(user_id):
+    return f'header-state:{user_id}'
+
+
+def _version_key(user_id):
+    return f'header-version:{user_id}'
+
+
+def _aggregate(queryset, **aggregates):
+    """``aggregates`` over ``queryset`` as subqueries correlated with the user."""
+    queryset = queryset.filter(user=OuterRef('pk')).order_by().values('user')
+    return {
+        name: Subquery(queryset.annotate(value=aggregate).values('value'))
+        for name, aggregate in aggregates.items()
+    }
+
+
+def _db_version(user):
+    """What the counts depend on: the user's orders, wishlist and notifications, in one query."""
+    from django.contrib.auth.models import User
+    from apps.orders.models import Order
+    from apps.custom_admin.models import Notification
+    from .models import Wishlist
+
+    return User.objects.filter(pk=user.pk).values(
+        **_aggregate(Order.objects, order_count=Count('id'), order_updated=Max('updated_at')),
+        **_aggregate(Wishlist.objects, wishlist_count=Count('id'), wishlist_last=Max('id')),
+        **_aggregate(Notification.objects, notification_count=Count('id'), notification_last=Max('id')),
+        **_aggregate(Notification.objects.filter(is_read=False), unread_count=Count('id')),
+    ).first()
+
+
+def invalidate(*user_ids):
+    """Drop the cached counts and version of the given users, now and once the transaction commits."""
+    keys = [key(user_id) for user_id in user_ids if user_id for key in (_cache_key, _version_key)]
+    cache.delete_many(keys)
+    # A request in between may have cached what the transaction is replacing
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _user_counts(user):
+    from apps.orders.models import Order
+    from apps.custom_admin.models import Notification
+    from .models import Wishlist
+
+    key = _cache_key(user.pk)
+    version = cache.get(_version_key(user.pk))
+    if version is None:
+        version = _db_version(user)
+        cache.set(_version_key(user.pk), version, VERSION_TIMEOUT)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    now = timezone.now()
+    payable = Order.objects.filter(
+        user=user,
+        payment_method='sslcommerz',
+        payment_timeout__gt=now
+    ).filter(
+        Q(status='pending') | Q(status='failed')
+    ).aggregate(count=Count('id'), expires=Min('payment_timeout'))
+
+    counts = {
+        'wishlist': Wishlist.objects.filter(user=user).count(),
+        'payable': payable['count'],
+        'notifications': Notification.objects.filter(user=user, is_read=False).count(),
+    }
+    # The payable count drops by itself when the first payment window closes
+    timeout = CACHE_TIMEOUT
+    if payable['expires']:
+        timeout = max(1, min(timeout, int((payable['expires'] - now).total_seconds()) + 1))
+    cache.set(key, (version, counts), timeout)
+    return counts
+
+
+def get_header_counts(request):
+    """``{'cart', 'wishlist', 'payable', 'notifications'}`` for the current visitor, memoized per request."""
+    if hasattr(request, '_header_counts'):
+        return request._header_counts
+
+    from .cart import Cart
+
+    counts = {'cart': 0, 'wishlist': 0, 'payable': 0, 'notifications': 0}
+    # A visitor without a session has no cart; don't start a session to say so
+    if request.user.is_authenticated or request.session.session_key:
+        counts['cart'] = Cart(request).summary['count']
+    if request.user.is_authenticated:
+        counts.update(_user_counts(request.user))
+    request._header_counts = counts
+    return counts
+
+
+def header_etag(request, *args, **kwargs):
+    counts = get_header_counts(request)
+    return hashlib.md5(json.dumps(counts, sort_keys=True).encode()).hexdigest()
@@ -0,0 +1,196 @@
+"""
+Responsive image derivatives for uploaded product, campaign and profile images.
+
+For an upload such as ``products/laptop.jpg`` resized WebP copies are written
+next to it (``products/laptop_320w.webp`` ...). They are produced in a small
+thread pool right after the model is saved, or lazily the first time a
+template asks for an image that has none yet; until then templates keep
+using the original file. A lock file next to the original makes sure only
+one worker process renders a given image.
+"""
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.files.storage import default_storage
+
+DERIVATIVE_WIDTHS = (160, 320, 640, 1280)
+WEBP_QUALITY = 80
+STALE_LOCK_SECONDS = 300
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-derivatives')
+_lock = threading.Lock()
+# image name -> tuple of widths that exist on disk (once checked or rendered)
+_available = {}
+# image name -> width of the original as displayed (None when unreadable)
+_source_widths = {}
+_pending = set()
+
+
+def derivative_name(name, width):
+    root, _ = os.path.splitext(name)
+    return f'{root}_{width}w.webp'
+
+
+def _local_path(name):
+    try:
+        return default_storage.path(name)
+    except NotImplementedError:
+        # Remote storage: derivatives are not supported
+        return None
+
+
+def _source_width(path):
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            # EXIF orientations 5-8 are displayed turned by a quarter
+            if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                width = height
+        return width
+    except Exception:
+        return None
+
+
+def _scan(name):
+    """Return the widths whose derivative file exists for ``name``."""
+    if name not in _source_widths:
+        source = _local_path(name)
+        _source_widths[name] = _source_width(source) if source and os.path.exists(source) else None
+    widths = []
+    for width in DERIVATIVE_WIDTHS:
+        path = _local_path(derivative_name(name, width))
+        if path and os.path.exists(path):
+            widths.append(width)
+    return tuple(widths)
+
+
+def generate_derivatives(name):
+    """
+    Render every derivative of ``name`` that is missing or older than the original.
+
+    Widths larger than the original are skipped rather than upscaled.
+    Returns the widths available afterwards.
+    """
+    from PIL import Image, ImageOps
+
+    source = _local_path(name)
+    if not source or not os.path.exists(source):
+        with _lock:
+            _available[name] = ()
+        return ()
+
+    lock_path = source + '.lock'
+    if os.path.exists(lock_path) and time.time() - os.path.getmtime(lock_path) > STALE_LOCK_SECONDS:
+        # Left behind by a worker that died mid-render
+        os.remove(lock_path)
+    try:
+        lock_fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        # Another process is rendering this image
+        return _scan(name)
+
+    failed = False
+    try:
+        source_mtime = os.path.getmtime(source)
+        with Image.open(source) as original:
+            image = ImageOps.exif_transpose(original)
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+            _source_widths[name] = image.width
+            for width in DERIVATIVE_WIDTHS:
+                target = _local_path(derivative_name(name, width))
+                if os.path.exists(target) and os.path.getmtime(target) >= source_mtime:
+                    continue
+                if width >= image.width and width != DERIVATIVE_WIDTHS[0]:
+                    continue
+                resized = image.copy()
+                resized.thumbnail((width, width * 4), Image.LANCZOS)
+                # Write to a temp file first so readers never see a partial image
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+                with os.fdopen(fd, 'wb') as tmp:
+                    resized.save(tmp, 'WEBP', quality=WEBP_QUALITY, method=4)
+                os.replace(tmp_path, target)
+    except Exception:
+        # Unreadable, unsupported or oversized image (PIL raises more than
+        # OSError); keep serving the original and do not try again
+        failed = True
+    finally:
+        os.close(lock_fd)
+        os.remove(lock_path)
+
+    widths = () if failed else _scan(name)
+    with _lock:
+        _available[name] = widths
+    return widths
+
+
+def _run(name):
+    try:
+        generate_derivatives(name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+
+
+def schedule(field_file):
+    """Queue derivative generation for an image field value."""
+    name = getattr(field_file, 'name', None)
+    if not name or name.startswith(('http://', 'https://')):
+        return
+    with _lock:
+        if name in _pending or name in _available:
+            return
+        _pending.add(name)
+    _executor.submit(_run, name)
+
+
+def available_widths(field_file):
+    """
+    Widths available for an image, scheduling generation if there are none.
+
+    The filesystem is checked once per image and process; afterwards the
+    answer comes from memory.
+    """
+    name = getattr(field_file, 'name', None)
+    if not name or name.startswith(('http://', 'https://')):
+        return ()
+    widths = _available.get(name)
+    if widths is None:
+        widths = _scan(name)
+        if widths:
+            with _lock:
+                _available[name] = widths
+        else:
+            schedule(field_file)
+    return widths
+
+
+def srcset(field_file):
+    """
+    Return a ``srcset`` value listing the available derivatives.
+
+    The original is listed too, at its own width, when it is wider than
+    every derivative: with ``w`` descriptors the browser ignores ``src``,
+    so without it large screens would be capped at the widest derivative.
+    """
+    widths = available_widths(field_file)
+    candidates = [
+        f'{default_storage.url(derivative_name(field_file.name, width))} {width}w'
+        for width in widths
+    ]
+    source_width = _source_widths.get(field_file.name)
+    if candidates and source_width and source_width > max(widths):
+        candidates.append(f'{field_file.url} {source_width}w')
+    return ', '.join(candidates)
+
+
+def thumbnail_url(field_file, css_width):
+    """URL of the smallest derivative sharp at 2x ``css_width``, else the original."""
+    wanted = css_width * 2
+    for width in available_widths(field_file):
+        if width >= wanted:
+            return default_storage.url(derivative_name(field_file.name, width))
+    return field_file.url
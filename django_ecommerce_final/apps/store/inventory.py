@@ -0,0 +1,128 @@
+"""
+Inventory ledger.
+
+Every change to a product's stock is recorded as a ``StockMovement`` and
+applied to ``Product.stock`` as a relative ``F()`` update in the same
+transaction, so the column is a snapshot of the ledger's running sum and
+concurrent writers never overwrite each other's changes.
+
+``manage.py reconcile_inventory`` checks the snapshot against the ledger and
+can fold old movements into one opening balance per product, so the table
+grows with recent activity rather than with the shop's whole history.
+"""
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def per_product(amounts):
+    """A CASE expression picking each product's amount, for one bulk UPDATE."""
+    return Case(
+        *[When(pk=product_id, then=Value(amount)) for product_id, amount in amounts.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def log(deltas, reason, order=None):
+    """Record ``deltas`` (``{product_id: signed qty}``) without touching stock; the caller applies them."""
+    from .models import StockMovement
+
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=product_id, quantity=delta, reason=reason, order=order)
+        for product_id, delta in deltas.items() if delta
+    ])
+
+
+def adjust(deltas, reason, order=None):
+    """Apply ``deltas`` to stock with one UPDATE and record them."""
+    from .models import Product
+
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    with transaction.atomic():
+        Product.objects.filter(pk__in=deltas).update(
+            stock=F('stock') + per_product(deltas),
+            updated_at=timezone.now(),
+        )
+        log(deltas, reason, order)
+
+
+def with_ledger_total(queryset):
+    """Annotate products with ``ledger_total``, the sum of their movements, read in the same query as stock."""
+    from .models import StockMovement
+
+    total = (
+        StockMovement.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        .annotate(total=Sum('quantity')).values('total')
+    )
+    return queryset.annotate(ledger_total=Coalesce(Subquery(total), 0))
+
+
+def find_mismatches(batch_size=1000):
+    """Yield ``(product_id, stock, ledger_total)`` for every product whose snapshot disagrees."""
+    from .models import Product
+
+    last_id = 0
+    while True:
+        batch = list(
+            with_ledger_total(Product.objects.filter(pk__gt=last_id)).order_by('pk')
+            .values_list('pk', 'stock', 'ledger_total')[:batch_size]
+        )
+        if not batch:
+            return
+        for pk, stock, total in batch:
+            if stock != total:
+                yield pk, stock, total
+        last_id = batch[-1][0]
+
+
+def fix_mismatches(product_ids):
+    """
+    Record an adjustment for each of ``product_ids`` whose stock still disagrees with the ledger.
+
+    The products are re-read with their rows locked, so a sale committed
+    since ``find_mismatches`` saw them is not counted twice. Returns
+    ``{product_id: adjustment}``.
+    """
+    from .models import Product
+
+    with transaction.atomic():
+        rows = with_ledger_total(Product.objects.select_for_update().filter(pk__in=product_ids)).values_list(
+            'pk', 'stock', 'ledger_total',
+        )
+        deltas = {pk: stock - total for pk, stock, total in rows if stock != total}
+        log(deltas, 'adjustment')
+    return deltas
+
+
+def compact(before, batch_size=1000):
+    """
+    Replace each product's movements older than ``before`` with one opening balance.
+
+    Runs one transaction per batch of products; the running sums are unchanged.
+    Returns the number of movements removed.
+    """
+    from .models import Product, StockMovement
+
+    removed = 0
+    last_id = 0
+    while True:
+        ids = list(Product.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return removed
+        with transaction.atomic():
+            old = StockMovement.objects.filter(product_id__in=ids, created_at__lt=before)
+            sums = list(old.values_list('product_id').annotate(total=Sum('quantity'), rows=Count('id')))
+            # Products whose history is already a single opening row are left alone
+            sums = [(pk, total) for pk, total, rows in sums if rows > 1]
+            if sums:
+                deleted, _ = old.filter(product_id__in=[pk for pk, _ in sums]).delete()
+                StockMovement.objects.bulk_create([
+                    StockMovement(product_id=pk, quantity=total, reason='opening', created_at=before)
+                    for pk, total in sums
+                ])
+                removed += deleted - len(sums)
+        last_id = ids[-1]
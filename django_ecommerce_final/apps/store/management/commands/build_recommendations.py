@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from apps.store.recommendations import update_copurchase_counts
+
+
+class Command(BaseCommand):
+    help = 'Mine order status changes into co-purchase recommendations (incremental)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of order events processed per transaction')
+        parser.add_argument('--full', action='store_true',
+                            help='Discard existing counts and rebuild from the first order event')
+
+    def handle(self, *args, **options):
+        orders, pairs = update_copurchase_counts(
+            chunk_size=options['chunk_size'],
+            full=options['full'],
+            stdout=self.stdout,
+        )
+        if orders == 0:
+            self.stdout.write('No orders entered or left completed since the last run.')
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f'Counted {orders} order(s) in or out, updated {pairs} product pair(s).')
+            )
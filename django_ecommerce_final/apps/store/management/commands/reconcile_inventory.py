@@ -0,0 +1,33 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.store import inventory
+
+
+class Command(BaseCommand):
+    help = 'Check Product.stock against the inventory ledger, optionally compacting old movements'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compact-days', type=int, default=None,
+                            help='Fold movements older than this many days into one opening balance per product')
+        parser.add_argument('--fix', action='store_true',
+                            help='Record an adjustment for every mismatch so the ledger matches stock')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products per query/transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['compact_days'] is not None:
+            before = timezone.now() - timedelta(days=options['compact_days'])
+            removed = inventory.compact(before, batch_size=batch_size)
+            self.stdout.write(self.style.SUCCESS(f'Compacted {removed} movement(s) older than {before:%Y-%m-%d %H:%M}.'))
+
+        mismatches = list(inventory.find_mismatches(batch_size=batch_size))
+        for product_id, stock, total in mismatches[:50]:
+            self.stdout.write(f'Product {product_id}: stock {stock}, ledger {total}')
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Stock matches the ledger for every product.'))
+        elif options['fix']:
+            fixed = inventory.fix_mismatches([product_id for product_id, _, _ in mismatches])
+            self.stdout.write(self.style.SUCCESS(f'Recorded adjustments for {len(fixed)} product(s).'))
+        else:
+            raise CommandError(f'{len(mismatches)} product(s) disagree with the ledger; rerun with --fix to record adjustments.')
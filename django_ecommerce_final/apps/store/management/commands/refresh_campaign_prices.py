@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from apps.store.pricing import sweep_campaign_prices
+
+
+class Command(BaseCommand):
+    help = 'Recompute materialized campaign prices; run from cron so campaign start/end times take effect'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, sweeping every --interval seconds')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between sweeps with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            updated = sweep_campaign_prices()
+            if updated or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Updated the effective price of {updated} product(s).'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
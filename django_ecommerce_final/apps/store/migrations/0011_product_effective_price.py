@@ -0,0 +1,62 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+from decimal import Decimal
+from django.db.models import F
+from django.utils import timezone
+
+
+def populate_effective_price(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Campaign = apps.get_model('store', 'Campaign')
+
+    Product.objects.update(effective_price=F('price'))
+
+    now = timezone.now()
+    links = Campaign.products.through.objects.filter(
+        campaign__is_active=True,
+        campaign__start_time__lte=now,
+        campaign__end_time__gte=now,
+    ).select_related('campaign', 'product').order_by('campaign_id')
+    discounted = {}
+    for link in links:
+        discounted.setdefault(link.product_id, (link.product, link.campaign))
+
+    changed = []
+    for product, campaign in discounted.values():
+        if campaign.discount_percentage > 0:
+            discount = product.price * Decimal(campaign.discount_percentage) / Decimal(100)
+            product.effective_price = (product.price - discount).quantize(Decimal('0.01'))
+        product.active_campaign = campaign
+        changed.append(product)
+    Product.objects.bulk_update(changed, ['effective_price', 'active_campaign'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_copurchase'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='store_produ_price_aba1d8_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='active_campaign',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.campaign'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['effective_price', 'id'], name='store_produ_effecti_707a96_idx'),
+        ),
+        migrations.RunPython(populate_effective_price, migrations.RunPython.noop),
+    ]
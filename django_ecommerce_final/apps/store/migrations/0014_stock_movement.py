@@ -0,0 +1,42 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def open_balances(apps, schema_editor):
+    # Start every product's ledger at its current stock
+    Product = apps.get_model('store', 'Product')
+    StockMovement = apps.get_model('store', 'StockMovement')
+    StockMovement.objects.bulk_create([
+        StockMovement(product_id=pk, quantity=stock, reason='opening')
+        for pk, stock in Product.objects.exclude(stock=0).values_list('pk', 'stock').iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_ordernumbersequence'),
+        ('store', '0013_product_reserved'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(help_text='Signed: negative when stock leaves')),
+                ('reason', models.CharField(choices=[('opening', 'Opening balance'), ('sale', 'Sale'), ('cancellation', 'Cancellation'), ('adjustment', 'Manual adjustment'), ('restock', 'Restock')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='orders.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='store.product')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['product', 'created_at'], name='store_stock_product_860bf2_idx')],
+            },
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_stock_movement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='savedcart',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
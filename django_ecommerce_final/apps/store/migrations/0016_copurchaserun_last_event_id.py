@@ -0,0 +1,34 @@
+# Generated by Django 4.2.10 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+def discard_counts(apps, schema_editor):
+    # Counts mined by order id cannot be resumed by event id; the next
+    # build_recommendations run replays the order timelines from the start
+    apps.get_model('store', 'CoPurchase').objects.all().delete()
+    apps.get_model('store', 'CoPurchaseRun').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_savedcart_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(discard_counts, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='copurchaserun',
+            options={'ordering': ['-last_event_id']},
+        ),
+        migrations.RemoveField(
+            model_name='copurchaserun',
+            name='last_order_id',
+        ),
+        migrations.AddField(
+            model_name='copurchaserun',
+            name='last_event_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
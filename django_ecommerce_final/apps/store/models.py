@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.text import slugify
 from django.urls import reverse
 
@@ -6,6 +7,7 @@ class Category(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(max_length=100, unique=True, null=True, blank=True)
     icon = models.CharField(max_length=50, default="fas fa-tag", help_text="FontAwesome icon class")
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name_plural = "Categories"
@@ -25,17 +27,38 @@ class Product(models.Model):
     description = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField(default=10)
+    # Units held by unpaid orders; only changed through apps.orders.reservations
+    reserved = models.IntegerField(default=0, editable=False)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
     is_featured = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Price after the running campaign's discount, kept current by
+    # pricing.refresh_effective_prices() so listings can sort on it; shown
+    # prices come from get_display_price(), which does not wait for it
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    active_campaign = models.ForeignKey('Campaign', on_delete=models.SET_NULL, null=True, blank=True,
+                                        editable=False, related_name='+')
+    
+    class Meta:
+        # Back the storefront sort orders used for keyset pagination
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['effective_price', 'id']),
+        ]
     
     def __str__(self):
         return self.name
 
+    @property
+    def available_stock(self):
+        """Stock that is not held by orders awaiting payment"""
+        return max(self.stock - self.reserved, 0)
+
     @property
     def is_in_stock(self):
         """Check if product is in stock"""
-        return self.stock > 0
+        return self.available_stock > 0
 
     def save(self, *args, **kwargs):
         # Prevent negative stock
@@ -43,9 +66,12 @@ class Product(models.Model):
             self.stock = 0
         
         # Check stock changes for existing products
+        old_product = None
+        stock_delta = 0
         if self.pk:
             try:
                 old_product = Product.objects.get(pk=self.pk)
+                stock_delta = self.stock - old_product.stock
                 
                 # If stock was positive and now is 0 or below, create admin notification
                 if old_product.stock > 0 and self.stock <= 0:
@@ -59,13 +85,38 @@ class Product(models.Model):
                 # If stock was 0 and now is positive, notify subscribed users
                 if old_product.stock <= 0 and self.stock > 0:
                     self._send_restock_notifications()
+                
+                # Stock and the reservation counter move concurrently through
+                # F() updates; never write back this instance's copies. A
+                # stock edit is applied as a ledger movement below instead.
+                if not kwargs.get('force_insert'):
+                    fields = kwargs.get('update_fields') or [
+                        field.name for field in self._meta.concrete_fields if not field.primary_key
+                    ]
+                    if 'stock' not in fields:
+                        stock_delta = 0
+                    kwargs['update_fields'] = [name for name in fields if name not in ('stock', 'reserved')]
                     
             except Product.DoesNotExist:
                 pass
         
         if not self.slug:
             self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        
+        # Keep the materialized price in step with a price edit
+        from .pricing import apply_discount
+        from .campaigns import timeline
+        campaign = timeline.campaign_for(self.pk) if self.pk else None
+        self.active_campaign = campaign
+        self.effective_price = apply_discount(self.price, campaign)
+        self._active_campaign, self._display_price = campaign, self.effective_price
+        from . import inventory
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if old_product is None:
+                inventory.log({self.pk: self.stock}, 'opening')
+            elif stock_delta:
+                inventory.adjust({self.pk: stock_delta}, 'restock' if stock_delta > 0 else 'adjustment')
     
     def _send_restock_notifications(self):
         """Send notifications to users who subscribed for restock alerts"""
@@ -94,24 +145,19 @@ class Product(models.Model):
         return reverse('product_detail', args=[self.slug])
 
     def get_active_campaign(self):
-        """Returns the first active campaign this product belongs to."""
-        from django.utils import timezone
-        now = timezone.now()
-        # Filter campaigns that are active and currently within their time range
-        return self.campaigns.filter(
-            is_active=True,
-            start_time__lte=now,
-            end_time__gte=now
-        ).first()
+        """Returns the campaign currently discounting this product."""
+        # Use the value attached by pricing.attach_pricing() when available
+        if not hasattr(self, '_active_campaign'):
+            from .campaigns import timeline
+            self._active_campaign = timeline.campaign_for(self.pk)
+        return self._active_campaign
 
     def get_display_price(self):
-        """Calculates and returns the discounted price if an active campaign exists."""
-        campaign = self.get_active_campaign()
-        if campaign and campaign.discount_percentage > 0:
-            from decimal import Decimal
-            discount = (self.price * Decimal(campaign.discount_percentage)) / Decimal(100)
-            return (self.price - discount).quantize(Decimal('0.01'))
-        return self.price
+        """Returns the discounted price if an active campaign exists."""
+        if not hasattr(self, '_display_price'):
+            from .pricing import apply_discount
+            self._display_price = apply_discount(self.price, self.get_active_campaign())
+        return self._display_price
 
 class Campaign(models.Model):
     title = models.CharField(max_length=200)
@@ -120,6 +166,7 @@ class Campaign(models.Model):
     end_time = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     discount_percentage = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
     
     # Products associated with this campaign
     products = models.ManyToManyField(Product, related_name='campaigns')
@@ -174,3 +221,85 @@ class RestockNotification(models.Model):
     def __str__(self):
         status = "Notified" if self.notified else "Pending"
         return f"{self.user.username} - {self.product.name} ({status})"
+
+class CoPurchase(models.Model):
+    """How many completed orders contained both products (stored in both directions)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='copurchases')
+    related_product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('product', 'related_product')
+        indexes = [
+            # Top-K lookup for a product's recommendations
+            models.Index(fields=['product', '-orders_count']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} + {self.related_product_id} ({self.orders_count})"
+
+class CoPurchaseRun(models.Model):
+    """Checkpoint of the co-purchase miner; the next run resumes after last_event_id"""
+    # Highest OrderEvent consumed: orders are counted as they enter and leave 'completed'
+    last_event_id = models.BigIntegerField(default=0)
+    orders_processed = models.PositiveIntegerField(default=0)
+    pairs_updated = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-last_event_id']
+    
+    def __str__(self):
+        return f"Co-purchase run up to order event {self.last_event_id}"
+
+class SavedCart(models.Model):
+    """A user's cart when PERSISTENT_CART is enabled"""
+    from django.contrib.auth.models import User
+    
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='saved_cart')
+    # Bumped on every change; cached copies of the cart are keyed by it
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Cart of {self.user.username}"
+
+class SavedCartItem(models.Model):
+    """One line of a SavedCart; written individually as the cart changes"""
+    cart = models.ForeignKey(SavedCart, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField(default=1)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    class Meta:
+        unique_together = ('cart', 'product')
+    
+    def __str__(self):
+        return f"{self.product_id} x {self.quantity}"
+
+STOCK_MOVEMENT_REASONS = [
+    ('opening', 'Opening balance'),
+    ('sale', 'Sale'),
+    ('cancellation', 'Cancellation'),
+    ('adjustment', 'Manual adjustment'),
+    ('restock', 'Restock'),
+]
+
+class StockMovement(models.Model):
+    """One change to a product's stock; Product.stock is the running sum of these"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    quantity = models.IntegerField(help_text="Signed: negative when stock leaves")
+    reason = models.CharField(max_length=20, choices=STOCK_MOVEMENT_REASONS)
+    order = models.ForeignKey('orders.Order', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Not auto_now_add: compaction dates the opening balance it writes
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Per-product sums for reconciliation and compaction
+            models.Index(fields=['product', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} {self.quantity:+d} ({self.reason})"
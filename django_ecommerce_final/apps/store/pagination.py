@@ -0,0 +1,101 @@
+import base64
+import binascii
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+PRODUCTS_PER_PAGE = 24
+
+# sort key -> (field, descending). The primary key is always the tie-breaker.
+SORT_ORDERINGS = {
+    'latest': ('created_at', True),
+    # Sort on the materialized campaign price, i.e. what the shopper pays
+    'price_low': ('effective_price', False),
+    'price_high': ('effective_price', True),
+    # Only valid on querysets annotated by search.search_products()
+    'relevance': ('search_rank', False),
+}
+
+
+def get_ordering(sort_by):
+    """Return the ``order_by`` arguments for a storefront sort key."""
+    field, descending = SORT_ORDERINGS.get(sort_by, SORT_ORDERINGS['latest'])
+    if descending:
+        return ('-' + field, '-id')
+    return (field, 'id')
+
+
+def encode_position(value, pk):
+    """Build an opaque cursor pointing just after the row with ``(value, pk)``."""
+    value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+    payload = json.dumps([value, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def encode_cursor(product, sort_by):
+    """Build an opaque cursor pointing just after ``product``."""
+    field, _ = SORT_ORDERINGS.get(sort_by, SORT_ORDERINGS['latest'])
+    return encode_position(getattr(product, field), product.pk)
+
+
+def decode_cursor(cursor, field=None):
+    """
+    Return ``(value, pk)`` from a cursor, or None if it is malformed.
+
+    With a model ``field`` the value is converted by it, so a cursor whose
+    value the field rejects counts as malformed instead of failing the query.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if field is not None:
+            value = field.to_python(value)
+            if value is None:
+                return None
+        return value, int(pk)
+    except (binascii.Error, ValueError, TypeError, ValidationError):
+        return None
+
+
+def _sort_field(queryset, name):
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    return queryset.model._meta.get_field(name)
+
+
+def paginate_keyset(queryset, field, descending, cursor=None, per_page=PRODUCTS_PER_PAGE):
+    """
+    Fetch one page of ``queryset`` ordered by ``(field, id)`` after ``cursor``.
+
+    Unlike OFFSET pagination the cost does not grow with the page depth: the
+    cursor is turned into a ``(field, id) > (value, pk)`` filter that the
+    database can satisfy from the index. Returns ``(rows, next_cursor)``.
+    """
+    if descending:
+        queryset = queryset.order_by('-' + field, '-id')
+    else:
+        queryset = queryset.order_by(field, 'id')
+
+    position = decode_cursor(cursor, _sort_field(queryset, field))
+    if position:
+        value, pk = position
+        op = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{op}': value}) |
+            Q(**{field: value, f'id__{op}': pk})
+        )
+
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_position(getattr(rows[-1], field), rows[-1].pk)
+    return rows, next_cursor
+
+
+def keyset_page(queryset, sort_by, cursor=None, per_page=PRODUCTS_PER_PAGE):
+    """Fetch one page of products after ``cursor`` for a storefront sort key."""
+    field, descending = SORT_ORDERINGS.get(sort_by, SORT_ORDERINGS['latest'])
+    return paginate_keyset(queryset, field, descending, cursor, per_page)
@@ -0,0 +1,120 @@
+from decimal import Decimal
+from django.utils import timezone
+
+
+def apply_discount(price, campaign):
+    """Return ``price`` with the campaign discount applied, rounded to paisa."""
+    if campaign and campaign.discount_percentage > 0:
+        discount = (price * Decimal(campaign.discount_percentage)) / Decimal(100)
+        return (price - discount).quantize(Decimal('0.01'))
+    return price
+
+
+def get_active_campaigns(product_ids, now=None):
+    """
+    Resolve the running campaign for every product id in a single query.
+
+    Mirrors ``Product.get_active_campaign``: when a product belongs to several
+    running campaigns, the one with the lowest id wins.
+    """
+    from .models import Campaign
+
+    product_ids = set(product_ids)
+    if not product_ids:
+        return {}
+
+    now = now or timezone.now()
+    links = Campaign.products.through.objects.filter(
+        product_id__in=product_ids,
+        campaign__is_active=True,
+        campaign__start_time__lte=now,
+        # The end instant is already over, as in the campaign timeline
+        campaign__end_time__gt=now,
+    ).select_related('campaign').order_by('campaign_id')
+
+    campaigns = {}
+    for link in links:
+        campaigns.setdefault(link.product_id, link.campaign)
+    return campaigns
+
+
+def attach_pricing(products, now=None):
+    """
+    Attach the active campaign and display price to a batch of products.
+
+    Accepts any iterable of products (querysets are evaluated) and returns a
+    list. Campaigns come from the in-process timeline, the same source
+    ``Product.get_display_price`` reads, so the cart charges what the
+    storefront shows. Afterwards ``get_active_campaign()`` and
+    ``get_display_price()`` are answered from the attached values.
+    """
+    from .campaigns import timeline
+
+    products = list(products)
+    now = now or timezone.now()
+    for product in products:
+        campaign = timeline.campaign_for(product.id, now)
+        product._active_campaign = campaign
+        product._display_price = apply_discount(product.price, campaign)
+    return products
+
+
+def refresh_effective_prices(product_ids, now=None, batch_size=500):
+    """
+    Recompute the materialized ``effective_price``/``active_campaign`` columns.
+
+    These back price sorting only; displayed and charged prices are resolved
+    live (see ``attach_pricing``).
+
+    Campaigns are resolved in bulk and only rows whose values changed are
+    written (with a fresh ``updated_at``, so cached cards and catalog ETags
+    follow). Returns the number of products updated.
+    """
+    from .models import Product
+
+    now = now or timezone.now()
+    product_ids = sorted(set(product_ids))
+    updated = 0
+    for start in range(0, len(product_ids), batch_size):
+        chunk = product_ids[start:start + batch_size]
+        campaigns = get_active_campaigns(chunk, now=now)
+        changed = []
+        for product in Product.objects.filter(id__in=chunk).only('id', 'price', 'effective_price', 'active_campaign_id'):
+            campaign = campaigns.get(product.id)
+            price = apply_discount(product.price, campaign)
+            campaign_id = campaign.id if campaign else None
+            if product.effective_price != price or product.active_campaign_id != campaign_id:
+                product.effective_price = price
+                product.active_campaign_id = campaign_id
+                product.updated_at = now
+                changed.append(product)
+        Product.objects.bulk_update(changed, ['effective_price', 'active_campaign', 'updated_at'])
+        updated += len(changed)
+    return updated
+
+
+def campaign_product_ids(campaign_ids=None):
+    """
+    Ids of products whose effective price may depend on the given campaigns
+    (all campaigns when None): their members plus any product currently
+    pointing at one of them.
+    """
+    from .models import Campaign, Product
+
+    links = Campaign.products.through.objects.all()
+    discounted = Product.objects.filter(active_campaign__isnull=False)
+    if campaign_ids is not None:
+        links = links.filter(campaign_id__in=campaign_ids)
+        discounted = discounted.filter(active_campaign_id__in=campaign_ids)
+    return set(links.values_list('product_id', flat=True)) | set(discounted.values_list('id', flat=True))
+
+
+def sweep_campaign_prices(now=None):
+    """
+    Bring every campaign product's materialized price up to date at ``now``.
+
+    Saving a campaign refreshes its products right away; this sweep covers
+    the start/end boundaries passing with nothing saved and is meant to run
+    from cron (``manage.py refresh_campaign_prices``).
+    """
+    return refresh_effective_prices(campaign_product_ids(), now=now)
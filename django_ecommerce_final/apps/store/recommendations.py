@@ -0,0 +1,199 @@
+"""
+"Customers also bought" recommendations mined from completed orders.
+
+``update_copurchase_counts`` walks the order status timeline (``OrderEvent``)
+in id-ordered chunks. An order entering 'completed' adds its product pairs to
+``CoPurchase``; one leaving it (cancelled after payment, say) takes them away
+again, so orders completed or cancelled long after they were placed are
+counted correctly. Runs are incremental: each one records the highest event
+id it consumed in ``CoPurchaseRun`` and the next run starts from there.
+``get_related_products`` serves the top-K for a product from the cache, keyed
+by the latest run so a new run reaches every process, falling back to the old
+"same category" strip when there is not enough purchase history.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import combinations, groupby
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import Product, CoPurchase, CoPurchaseRun
+
+TOP_K = 12
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# Orders with more distinct products than this are truncated; a huge order
+# says little about affinity and its pairs grow quadratically.
+MAX_PRODUCTS_PER_ORDER = 50
+
+# Events are only consumed once this old, so a transaction that took an
+# event id but had not committed yet when a run passed it is not skipped.
+SETTLE_DELAY = timedelta(minutes=5)
+
+
+def _cache_key(product_id, build):
+    return f'copurchase:{build}:{product_id}'
+
+
+def _build_version():
+    # Every run writes a checkpoint, so the latest one versions the cached
+    # lists: each web worker sees a new run without being told. The time
+    # keeps a reused id (after a full rebuild) from matching an old key.
+    run = CoPurchaseRun.objects.aggregate(id=Max('id'), at=Max('created_at'))
+    return f"{run['id']}-{run['at'].timestamp() if run['at'] else 0}"
+
+
+def count_pairs(order_products):
+    """
+    Count co-occurring product pairs.
+
+    ``order_products`` is an iterable of ``(order_id, product_id)`` tuples
+    sorted by order id. Returns a Counter keyed by ``(product, related)`` in
+    both directions.
+    """
+    pairs = Counter()
+    for _, rows in groupby(order_products, key=lambda row: row[0]):
+        products = sorted({product_id for _, product_id in rows})[:MAX_PRODUCTS_PER_ORDER]
+        for a, b in combinations(products, 2):
+            pairs[(a, b)] += 1
+            pairs[(b, a)] += 1
+    return pairs
+
+
+def _order_pairs(order_ids):
+    from apps.orders.models import OrderItem
+
+    rows = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .order_by('order_id')
+        .values_list('order_id', 'product_id')
+        .iterator(chunk_size=2000)
+    )
+    return count_pairs(rows)
+
+
+def _merge_pairs(pairs):
+    """
+    Add ``pairs`` (negative for orders leaving 'completed') onto the stored
+    counts with one read and a few bulk writes; pairs dropping to zero are deleted.
+    """
+    by_product = defaultdict(dict)
+    for (product_id, related_id), count in pairs.items():
+        if count:
+            by_product[product_id][related_id] = count
+
+    existing = CoPurchase.objects.filter(product_id__in=by_product.keys())
+    to_update, to_delete = [], []
+    for row in existing:
+        count = by_product[row.product_id].pop(row.related_product_id, None)
+        if not count:
+            continue
+        row.orders_count = max(row.orders_count + count, 0)
+        if row.orders_count:
+            to_update.append(row)
+        else:
+            to_delete.append(row.pk)
+
+    # A removal always follows the addition it reverses, so leftovers are positive
+    to_create = [
+        CoPurchase(product_id=product_id, related_product_id=related_id, orders_count=count)
+        for product_id, related in by_product.items()
+        for related_id, count in related.items() if count > 0
+    ]
+    CoPurchase.objects.bulk_update(to_update, ['orders_count'], batch_size=500)
+    CoPurchase.objects.bulk_create(to_create, batch_size=500)
+    CoPurchase.objects.filter(pk__in=to_delete).delete()
+    return len(to_update) + len(to_create) + len(to_delete)
+
+
+def update_copurchase_counts(chunk_size=1000, full=False, stdout=None):
+    """
+    Fold order status changes since the last run into the co-purchase counts.
+
+    Events are processed ``chunk_size`` at a time, each chunk in its own
+    transaction together with its checkpoint, so an interrupted run resumes
+    where it stopped. ``full=True`` discards the counts and starts over.
+    Returns ``(orders_processed, pairs_updated)``, counting orders that were
+    added or taken away.
+    """
+    from apps.orders.models import OrderEvent
+
+    if full:
+        with transaction.atomic():
+            CoPurchase.objects.all().delete()
+            CoPurchaseRun.objects.all().delete()
+
+    last_event_id = CoPurchaseRun.objects.aggregate(last=Max('last_event_id'))['last'] or 0
+    cutoff = timezone.now() - SETTLE_DELAY
+    events = OrderEvent.objects.filter(created_at__lte=cutoff)
+
+    total_orders = total_pairs = 0
+    while True:
+        chunk = list(
+            events.filter(id__gt=last_event_id).order_by('id')
+            .values_list('id', 'order_id', 'status')[:chunk_size]
+        )
+        if not chunk:
+            break
+
+        # Whether each order was counted before this chunk and after it
+        final = {order_id: status for _, order_id, status in chunk}
+        previous = dict(
+            OrderEvent.objects.filter(order_id__in=final, id__lte=last_event_id)
+            .order_by('order_id', 'id').values_list('order_id', 'status')
+        )
+        added = [order_id for order_id, status in final.items()
+                 if status == 'completed' and previous.get(order_id) != 'completed']
+        removed = [order_id for order_id, status in final.items()
+                   if status != 'completed' and previous.get(order_id) == 'completed']
+        pairs = _order_pairs(added) if added else Counter()
+        if removed:
+            pairs.subtract(_order_pairs(removed))
+
+        with transaction.atomic():
+            pairs_updated = _merge_pairs(pairs)
+            CoPurchaseRun.objects.create(
+                last_event_id=chunk[-1][0],
+                orders_processed=len(added) + len(removed),
+                pairs_updated=pairs_updated,
+            )
+
+        last_event_id = chunk[-1][0]
+        total_orders += len(added) + len(removed)
+        total_pairs += pairs_updated
+        if stdout:
+            stdout.write(f'Processed order events up to #{last_event_id}: {total_orders} orders, {total_pairs} pairs')
+
+    # Cached top-K lists are keyed by the latest run, so they are replaced
+    return total_orders, total_pairs
+
+
+def get_recommended_ids(product_id, limit=TOP_K):
+    """Top co-purchased product ids for a product, served from the cache."""
+    key = _cache_key(product_id, _build_version())
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(
+            CoPurchase.objects.filter(product_id=product_id)
+            .order_by('-orders_count', 'related_product_id')
+            .values_list('related_product_id', flat=True)[:TOP_K]
+        )
+        cache.set(key, ids, CACHE_TIMEOUT)
+    return ids[:limit]
+
+
+def get_related_products(product, limit=4):
+    """Co-purchased products first, topped up from the same category."""
+    ids = get_recommended_ids(product.id, limit=limit)
+    products = Product.objects.all()
+    by_id = products.in_bulk(ids) if ids else {}
+    related = [by_id[pk] for pk in ids if pk in by_id]
+
+    if len(related) < limit:
+        exclude = [product.id] + [p.id for p in related]
+        related += list(
+            products.filter(category=product.category)
+            .exclude(id__in=exclude)[:limit - len(related)]
+        )
+    return related
@@ -0,0 +1,197 @@
+"""
+Full-text product search.
+
+On SQLite the catalog is mirrored into an FTS5 virtual table (``rowid`` is the
+product id) which is kept in sync from the Product/Category signals and can be
+rebuilt with ``manage.py rebuild_search_index``. On PostgreSQL the same
+columns are matched with a weighted ``tsvector``. Whenever no index is
+available the storefront falls back to the plain ``name__icontains`` filter.
+"""
+import unicodedata
+from django.db import connection, DatabaseError
+from django.db.models import Case, IntegerField, Value, When
+
+FTS_TABLE = 'store_product_fts'
+
+# Upper bound on ranked matches fed back into the listing queryset
+SEARCH_RESULT_LIMIT = 500
+
+# unicode61 normally splits words on combining marks, which breaks Bengali
+# vowel signs (e.g. "পা") into separate tokens. Keep marks (M*) inside tokens.
+FTS_TOKENIZER = "unicode61 remove_diacritics 2 categories 'L* N* Co M*'"
+
+# bm25() column weights for name, description and category
+FTS_WEIGHTS = (10.0, 2.0, 5.0)
+
+_index_ready = False
+
+
+def tokenize(text):
+    """Split text into search tokens using the same rules as the FTS tokenizer."""
+    tokens, current = [], []
+    for char in text or '':
+        if unicodedata.category(char)[0] in 'LNM':
+            current.append(char)
+        elif current:
+            tokens.append(''.join(current))
+            current = []
+    if current:
+        tokens.append(''.join(current))
+    return tokens
+
+
+def is_available():
+    """Return True if ranked search can be served by the database."""
+    global _index_ready
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor != 'sqlite':
+        return False
+    if not _index_ready:
+        _index_ready = FTS_TABLE in connection.introspection.table_names()
+    return _index_ready
+
+
+def create_index(schema_connection=None):
+    """Create the FTS5 table if the SQLite build supports it."""
+    global _index_ready
+    conn = schema_connection or connection
+    if conn.vendor != 'sqlite':
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+                f'USING fts5(name, description, category, '
+                f'tokenize="{FTS_TOKENIZER}", prefix=\'2 3\')'
+            )
+    except DatabaseError:
+        # SQLite compiled without FTS5
+        return False
+    _index_ready = True
+    return True
+
+
+def _rows(products):
+    return [
+        (p.id, p.name, p.description or '', p.category.name if p.category else '')
+        for p in products
+    ]
+
+
+def index_products(products):
+    """Insert or refresh the index rows for the given products."""
+    if connection.vendor != 'sqlite' or not is_available():
+        return
+    rows = _rows(products)
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)',
+            rows,
+        )
+
+
+def remove_products(product_ids):
+    """Drop the index rows for deleted products."""
+    if connection.vendor != 'sqlite' or not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+
+def rebuild_index(chunk_size=1000):
+    """Re-populate the whole index from the Product table in chunks."""
+    from .models import Product
+
+    if not create_index():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    total, batch = 0, []
+    products = Product.objects.select_related('category').order_by('id')
+    for product in products.iterator(chunk_size=chunk_size):
+        batch.append(product)
+        if len(batch) >= chunk_size:
+            index_products(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        index_products(batch)
+        total += len(batch)
+    return total
+
+
+def _sqlite_match(tokens, limit):
+    # Quote every token so user input cannot inject FTS syntax, then make the
+    # last one a prefix so "mac" already matches "MacBook" while typing.
+    terms = ['"%s"' % token.replace('"', '""') for token in tokens]
+    terms[-1] += '*'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, %s, %s, %s) LIMIT %s',
+            [' '.join(terms), *FTS_WEIGHTS, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _postgres_match(tokens, limit):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+    from .models import Product
+
+    vector = (
+        SearchVector('name', weight='A', config='simple') +
+        SearchVector('category__name', weight='B', config='simple') +
+        SearchVector('description', weight='C', config='simple')
+    )
+    terms = [token.replace("'", "''") for token in tokens]
+    query = SearchQuery(' & '.join("'%s':*" % term for term in terms), search_type='raw', config='simple')
+    return list(
+        Product.objects.annotate(rank=SearchRank(vector, query))
+        .filter(rank__gt=0)
+        .order_by('-rank', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+
+
+def search_product_ids(query, limit=SEARCH_RESULT_LIMIT):
+    """
+    Return product ids matching ``query`` ordered by relevance.
+
+    Returns None when no search index is available so callers can fall back.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    if not is_available():
+        return None
+    try:
+        if connection.vendor == 'postgresql':
+            return _postgres_match(tokens, limit)
+        return _sqlite_match(tokens, limit)
+    except DatabaseError:
+        return None
+
+
+def search_products(queryset, query):
+    """
+    Filter ``queryset`` down to products matching ``query``.
+
+    Each result is annotated with ``search_rank`` (0 is the best match) so the
+    listing can sort by relevance.
+    """
+    ids = search_product_ids(query)
+    if ids is None:
+        return queryset.filter(name__icontains=query).annotate(search_rank=Value(0, output_field=IntegerField()))
+    if not ids:
+        return queryset.none().annotate(search_rank=Value(0, output_field=IntegerField()))
+    return queryset.filter(id__in=ids).annotate(
+        search_rank=Case(
+            *[When(id=pk, then=Value(position)) for position, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+    )
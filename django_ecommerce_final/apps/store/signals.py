@@ -0,0 +1,111 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.contrib.auth.signals import user_logged_in
+from django.utils import timezone
+from django.dispatch import receiver
+from .models import Product, Category, Campaign, Wishlist
+from . import search, autocomplete, images, pricing, cart, header
+from .campaigns import timeline
+
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, **kwargs):
+    search.index_products([instance])
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, **kwargs):
+    if not created:
+        search.index_products(instance.products.select_related('category'))
+
+@receiver(pre_delete, sender=Category)
+def remember_category_products(sender, instance, **kwargs):
+    # Products are detached (SET_NULL) without their own save signal
+    instance._indexed_product_ids = list(instance.products.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Category)
+def reindex_detached_products(sender, instance, **kwargs):
+    product_ids = getattr(instance, '_indexed_product_ids', [])
+    if product_ids:
+        search.index_products(Product.objects.filter(id__in=product_ids).select_related('category'))
+
+@receiver(post_save, sender=Product)
+def update_product_suggestion(sender, instance, **kwargs):
+    autocomplete.index.update(autocomplete.PRODUCT, instance.pk, instance.name, instance.slug)
+
+@receiver(post_delete, sender=Product)
+def remove_product_suggestion(sender, instance, **kwargs):
+    autocomplete.index.remove(autocomplete.PRODUCT, instance.pk)
+
+@receiver(post_save, sender=Category)
+def update_category_suggestion(sender, instance, **kwargs):
+    autocomplete.index.update(autocomplete.CATEGORY, instance.pk, instance.name, instance.slug)
+
+@receiver(post_delete, sender=Category)
+def remove_category_suggestion(sender, instance, **kwargs):
+    autocomplete.index.remove(autocomplete.CATEGORY, instance.pk)
+
+@receiver(m2m_changed, sender=Campaign.products.through)
+def touch_campaign_on_products_change(sender, instance, action, reverse, pk_set, **kwargs):
+    # Changing the product set alone does not save the campaign row, but it
+    # changes prices on the storefront, so bump the catalog update stamp and
+    # the campaign rows other processes version their timeline by.
+    if reverse and action == 'pre_clear':
+        instance._touched_campaign_ids = list(instance.campaigns.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    now = timezone.now()
+    if reverse:
+        Product.objects.filter(pk=instance.pk).update(updated_at=now)
+        campaign_ids = pk_set if action != 'post_clear' else getattr(instance, '_touched_campaign_ids', ())
+    else:
+        campaign_ids = [instance.pk]
+    Campaign.objects.filter(pk__in=campaign_ids).update(updated_at=now)
+    timeline.invalidate()
+
+@receiver(post_save, sender=Campaign)
+@receiver(post_delete, sender=Campaign)
+def reload_campaign_timeline(sender, instance, **kwargs):
+    timeline.invalidate()
+
+@receiver(post_save, sender=Campaign)
+def refresh_campaign_prices(sender, instance, **kwargs):
+    pricing.refresh_effective_prices(pricing.campaign_product_ids([instance.pk]))
+
+@receiver(pre_delete, sender=Campaign)
+def remember_campaign_products(sender, instance, **kwargs):
+    # The links are gone by post_delete and active_campaign is only nulled
+    instance._priced_product_ids = pricing.campaign_product_ids([instance.pk])
+
+@receiver(post_delete, sender=Campaign)
+def refresh_prices_after_campaign_delete(sender, instance, **kwargs):
+    pricing.refresh_effective_prices(getattr(instance, '_priced_product_ids', ()))
+
+@receiver(m2m_changed, sender=Campaign.products.through)
+def refresh_prices_on_products_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            instance._priced_product_ids = {instance.pk}
+        else:
+            instance._priced_product_ids = pricing.campaign_product_ids([instance.pk])
+    elif action == 'post_clear':
+        pricing.refresh_effective_prices(getattr(instance, '_priced_product_ids', ()))
+    elif action in ('post_add', 'post_remove'):
+        pricing.refresh_effective_prices([instance.pk] if reverse else pk_set)
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Campaign)
+def generate_image_derivatives(sender, instance, **kwargs):
+    if instance.image:
+        images.schedule(instance.image)
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is not None:
+        cart.merge_session_cart(request, user)
+
+@receiver(post_save, sender=Wishlist)
+@receiver(post_delete, sender=Wishlist)
+def refresh_header_wishlist_count(sender, instance, **kwargs):
+    header.invalidate(instance.user_id)
@@ -0,0 +1,70 @@
+import hashlib
+from django import template
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone, translation
+from django.utils.safestring import mark_safe
+from apps.store import images
+
+register = template.Library()
+
+# Upper bound for a cached card; cards tied to a campaign expire with it
+CARD_CACHE_TIMEOUT = 60 * 60
+
+
+def card_cache_key(product, template_name, language):
+    """
+    Build the cache key for a rendered product card.
+
+    The key covers everything the card templates render: the product fields,
+    its stock state and the active campaign with its discount. Saving a
+    product, editing a campaign or a campaign starting/ending therefore moves
+    the card to a new key instead of serving a stale one, even when stock was
+    changed through ``QuerySet.update()`` and no save signal fired.
+    """
+    campaign = product.get_active_campaign()
+    parts = [
+        template_name, language, product.pk, product.name, product.slug,
+        product.price, product.get_display_price(), product.is_in_stock,
+        product.is_featured, product.image.name if product.image else '',
+        images.available_widths(product.image) if product.image else '',
+        campaign.pk if campaign else '', campaign.discount_percentage if campaign else '',
+    ]
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'product_card:{product.pk}:{digest}'
+
+
+def card_cache_timeout(product):
+    campaign = product.get_active_campaign()
+    if campaign and campaign.end_time:
+        remaining = int((campaign.end_time - timezone.now()).total_seconds())
+        return max(1, min(CARD_CACHE_TIMEOUT, remaining))
+    return CARD_CACHE_TIMEOUT
+
+
+@register.simple_tag
+def product_card(product, template_name='store/includes/product_card.html'):
+    """Render a product card through the per-product, per-language fragment cache."""
+    key = card_cache_key(product, template_name, translation.get_language())
+    html = cache.get(key)
+    if html is None:
+        # Cards are user-independent, so skip the request context processors
+        html = render_to_string(template_name, {'p': product})
+        cache.set(key, html, card_cache_timeout(product))
+    return mark_safe(html)
+
+
+@register.simple_tag
+def image_srcset(field_file):
+    """``srcset`` value for an uploaded image; empty until derivatives exist."""
+    if not field_file:
+        return ''
+    return images.srcset(field_file)
+
+
+@register.simple_tag
+def thumbnail_url(field_file, css_width):
+    """Smallest derivative that stays sharp when shown ``css_width`` pixels wide."""
+    if not field_file:
+        return ''
+    return images.thumbnail_url(field_file, int(css_width))
@@ -4,12 +4,15 @@ from .views import *
 
 urlpatterns=[
  path('', home, name='home'),
+ path('products/more/', product_list_fragment, name='product_list_fragment'),
+ path('search/autocomplete/', autocomplete, name='autocomplete'),
  path('add/<int:id>/', add_to_cart, name='add_to_cart'),
  path('cart/', cart_view, name='cart'),
  path('update/<int:id>/', update_cart, name='update_cart'),
  path('remove/<int:id>/', remove_cart, name='remove_cart'),
  path('cart/count/', get_cart_count, name='cart_count'),
  path('wishlist/count/', get_wishlist_count, name='wishlist_count'),
+ path('header/state/', header_state, name='header_state'),
  path('product/<slug:slug>/', product_detail, name='product_detail'),
  path('product/item/<int:id>/', product_detail, name='product_detail_id'),
  path('campaign/<int:campaign_id>/', campaign_detail, name='campaign_detail'),
@@ -1,36 +1,62 @@
 
 from django.shortcuts import render,redirect,get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_http_methods
-from django.http import JsonResponse
-from .models import Product, Category, Campaign
+from django.views.decorators.http import require_http_methods, condition
+from django.utils.cache import patch_cache_control
+from django.http import JsonResponse, Http404
+from django.core.paginator import Paginator
+from django.template.loader import render_to_string
+from .models import Product, Category
 from .cart import Cart
-from django.utils import timezone
+from .search import search_products
+from .recommendations import get_related_products
+from .conditional import catalog_condition
+from .header import get_header_counts, header_etag
+from .campaigns import timeline as campaign_timeline
+from .pagination import PRODUCTS_PER_PAGE, encode_cursor, get_ordering, keyset_page
 
-def home(request):
+def _filtered_products(request):
+    """Apply the storefront search/category filters shared by the listing views."""
     query = request.GET.get('query')
     category_slug = request.GET.get('category')
-    sort_by = request.GET.get('sort', 'latest')
     
     products = Product.objects.all()
-    categories = Category.objects.all()
-    
-    # Active Campaign with products
-    campaign = Campaign.objects.filter(is_active=True, end_time__gt=timezone.now()).first()
     
     if query:
-        products = products.filter(name__icontains=query)
+        products = search_products(products, query)
     
     if category_slug:
         products = products.filter(category__slug=category_slug)
     
-    # Apply sorting
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    else:  # latest
-        products = products.order_by('-created_at')
+    return products, query, category_slug
+
+def _get_sort(request, query):
+    """Searches default to relevance order; it is meaningless without a query."""
+    sort_by = request.GET.get('sort') or ('relevance' if query else 'latest')
+    if sort_by == 'relevance' and not query:
+        sort_by = 'latest'
+    return sort_by
+
+@catalog_condition()
+def home(request):
+    cursor = request.GET.get('cursor')
+    
+    products, query, category_slug = _filtered_products(request)
+    sort_by = _get_sort(request, query)
+    categories = Category.objects.all()
+    
+    # Running or upcoming campaign for the banner, from the in-memory timeline
+    campaign = campaign_timeline.featured()
+    
+    page_obj = None
+    if cursor:
+        # Keyset mode: constant cost no matter how deep the visitor scrolls
+        products, next_cursor = keyset_page(products, sort_by, cursor)
+    else:
+        paginator = Paginator(products.order_by(*get_ordering(sort_by)), PRODUCTS_PER_PAGE)
+        page_obj = paginator.get_page(request.GET.get('page'))
+        products = list(page_obj)
+        next_cursor = encode_cursor(products[-1], sort_by) if page_obj.has_next() else None
         
     context = {
         'products': products,
@@ -38,17 +64,47 @@ def home(request):
         'query': query,
         'campaign': campaign,
         'current_category': category_slug,
-        'current_sort': sort_by
+        'current_sort': sort_by,
+        'page_obj': page_obj,
+        'next_cursor': next_cursor,
     }
     return render(request, 'store/home.html', context)
 
+@require_http_methods(["GET"])
+def product_list_fragment(request):
+    """Return the next keyset page of product cards as HTML for infinite scroll"""
+    products, query, _ = _filtered_products(request)
+    sort_by = _get_sort(request, query)
+    products, next_cursor = keyset_page(products, sort_by, request.GET.get('cursor'))
+    
+    html = render_to_string('store/includes/product_card_list.html', {
+        'products': products,
+    }, request=request)
+    return JsonResponse({'html': html, 'next_cursor': next_cursor})
+
+@require_http_methods(["GET"])
+def autocomplete(request):
+    """Search box suggestions served from the in-memory prefix index"""
+    from .autocomplete import suggest
+    query = request.GET.get('q', '')
+    return JsonResponse({'query': query, 'suggestions': suggest(query)})
+
+def _product_user_state(request, slug=None, id=None):
+    """Wishlist/restock flags product_detail renders for the current user"""
+    from .models import Wishlist, RestockNotification
+    lookup = {'product__slug': slug} if slug else {'product_id': id}
+    in_wishlist = Wishlist.objects.filter(user=request.user, **lookup).exists()
+    restock_subscribed = RestockNotification.objects.filter(user=request.user, notified=False, **lookup).exists()
+    return f'{in_wishlist}:{restock_subscribed}'
+
+@catalog_condition(user_state=_product_user_state)
 def product_detail(request, slug=None, id=None):
     if slug:
         product = get_object_or_404(Product, slug=slug)
     else:
         product = get_object_or_404(Product, id=id)
     
-    related_products = Product.objects.filter(category=product.category).exclude(id=product.id)[:4]
+    related_products = get_related_products(product, limit=4)
     
     # Check if user is authenticated and has this product in wishlist
     in_wishlist = False
@@ -69,8 +125,11 @@ def product_detail(request, slug=None, id=None):
         'restock_subscribed': restock_subscribed
     })
 
+@catalog_condition()
 def campaign_detail(request, campaign_id):
-    campaign = get_object_or_404(Campaign, id=campaign_id)
+    campaign = campaign_timeline.get(campaign_id)
+    if campaign is None:
+        raise Http404('Campaign not found')
     products = campaign.products.all()
     return render(request, 'store/campaign_detail.html', {
         'campaign': campaign,
@@ -92,8 +151,8 @@ def add_to_cart(request,id):
     current_qty = cart.cart.get(str(id), {}).get('qty', 0)
     
     # Prevent adding more than available stock
-    if current_qty >= p.stock:
-        messages.warning(request, f"Cannot add more. Only {p.stock} items available.")
+    if current_qty >= p.available_stock:
+        messages.warning(request, f"Cannot add more. Only {p.available_stock} items available.")
         return redirect('cart')
     
     cart.add(p.id, p.get_display_price())
@@ -112,9 +171,9 @@ def update_cart(request,id):
         return redirect('cart')
     
     # Check stock availability
-    if qty > product.stock:
-        messages.warning(request, f"Only {product.stock} items available for {product.name}.")
-        Cart(request).update(id, product.stock)
+    if qty > product.available_stock:
+        messages.warning(request, f"Only {product.available_stock} items available for {product.name}.")
+        Cart(request).update(id, product.available_stock)
     else:
         Cart(request).update(id, qty)
         messages.success(request, "Cart updated successfully.")
@@ -129,36 +188,23 @@ def remove_cart(request,id):
 @login_required
 def cart_view(request):
  cart_obj = Cart(request)
- cart = cart_obj.cart
- cart_items = []
- items_to_remove = []
- 
- for id, item in cart.items():
-  try:
-   product = Product.objects.get(id=id)
-   # Always refresh price from DB to handle started/ended campaigns
-   current_price = product.get_display_price()
-   item['price'] = str(current_price)
-   cart_items.append({'product': product, 'qty': item['qty'], 'price': float(current_price)})
-  except Product.DoesNotExist:
-   items_to_remove.append(id)
- 
- # Save updated prices to session
- cart_obj.save()
- 
- # Remove invalid items
- for item_id in items_to_remove:
-  cart_obj.remove(item_id)
- 
- total = sum(float(i['price']) * i['qty'] for i in cart.values()) if cart else 0
+ # One query for all lines, priced from the campaign timeline like the
+ # storefront, so started/ended campaigns apply at once
+ cart_items = cart_obj.lines
+ total = cart_obj.total()
  return render(request,'store/cart.html',{'cart_items':cart_items, 'total': total})
 
 @login_required
 @require_http_methods(["GET", "POST"])
 def get_cart_count(request):
- cart = request.session.get('cart', {})
- count = sum(item['qty'] for item in cart.values()) if cart else 0
- return JsonResponse({'count': count})
+ # Maintained on every cart change, so this never reads the lines
+ summary = Cart(request).summary
+ return JsonResponse({
+  'count': summary['count'],
+  'lines': summary['lines'],
+  'subtotal': summary['subtotal'],
+  'version': summary['version'],
+ })
 
 @login_required
 @require_http_methods(["GET"])
@@ -168,6 +214,14 @@ def get_wishlist_count(request):
     count = Wishlist.objects.filter(user=request.user).count()
     return JsonResponse({'count': count})
 
+@require_http_methods(["GET"])
+@condition(etag_func=header_etag)
+def header_state(request):
+    """Cart, wishlist, payable order and unread notification counts for the header"""
+    response = JsonResponse(get_header_counts(request))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 # ============= WISHLIST VIEWS =============
 
 @login_required
@@ -192,7 +246,7 @@ def wishlist_view(request):
             'wishlist_item': item,
             'product': item.product,
             'in_stock': item.product.is_in_stock,
-            'stock': item.product.stock,
+            'stock': item.product.available_stock,
             'restock_subscribed': is_subscribed
         })
     
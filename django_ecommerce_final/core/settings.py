@@ -59,14 +59,31 @@ STATICFILES_DIRS=[BASE_DIR/'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Keep carts in the database (cached) instead of the session, so they
+# survive logout and follow the user across devices
+PERSISTENT_CART = config('PERSISTENT_CART', default=False, cast=bool)
+
+# Digits of the daily sequence in order numbers (YYYYMMDD + sequence); a
+# busier day simply gets longer numbers
+ORDER_NUMBER_WIDTH = config('ORDER_NUMBER_WIDTH', default=2, cast=int)
+
 # SSL Commerce Settings
 SSLCOMMERZ_STORE_ID='testbox'
 SSLCOMMERZ_STORE_PASS='qwerty'
-SSLCOMMERZ_API_URL='https://sandbox.sslcommerz.com/gwprocess/v4/api.php'
-SSLCOMMERZ_VALIDATION_URL='https://sandbox.sslcommerz.com/validator/api/validationserverAPI.php'
+# Point both URLs at `manage.py fake_sslcommerz` to run checkout without network access
+SSLCOMMERZ_API_URL=config('SSLCOMMERZ_API_URL', default='https://sandbox.sslcommerz.com/gwprocess/v4/api.php')
+SSLCOMMERZ_VALIDATION_URL=config('SSLCOMMERZ_VALIDATION_URL', default='https://sandbox.sslcommerz.com/validator/api/validationserverAPI.php')
 SSLCOMMERZ_SUCCESS_URL='payment/success/'
 SSLCOMMERZ_FAIL_URL='payment/fail/'
 SSLCOMMERZ_CANCEL_URL='payment/cancel/'
 SSLCOMMERZ_IPN_URL='payment/ipn/'
+# Gateway client (apps.orders.gateway): seconds to connect / to wait for a
+# response, retries per call, and the circuit breaker that stops calling a
+# gateway after that many consecutive failures for the cooldown
+SSLCOMMERZ_CONNECT_TIMEOUT=config('SSLCOMMERZ_CONNECT_TIMEOUT', default=3.05, cast=float)
+SSLCOMMERZ_READ_TIMEOUT=config('SSLCOMMERZ_READ_TIMEOUT', default=10, cast=float)
+SSLCOMMERZ_RETRIES=config('SSLCOMMERZ_RETRIES', default=2, cast=int)
+SSLCOMMERZ_BREAKER_FAILURES=config('SSLCOMMERZ_BREAKER_FAILURES', default=5, cast=int)
+SSLCOMMERZ_BREAKER_COOLDOWN=config('SSLCOMMERZ_BREAKER_COOLDOWN', default=30, cast=float)
 
 DEFAULT_AUTO_FIELD='django.db.models.BigAutoField'